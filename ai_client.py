@@ -38,6 +38,25 @@ from enum import Enum
 
 logger = logging.getLogger(__name__)
 
+# 每个事件循环共享一个 ClientSession，复用 TCP/TLS 连接与 DNS 缓存
+_http_sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+
+def get_http_session() -> aiohttp.ClientSession:
+    """获取当前事件循环共享的 HTTP 会话（必须在协程中调用）"""
+    loop = asyncio.get_running_loop()
+    session = _http_sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(limit=32, ttl_dns_cache=300, enable_cleanup_closed=True)
+        session = aiohttp.ClientSession(connector=connector)
+        _http_sessions[loop] = session
+    return session
+
+async def close_http_session():
+    """关闭当前事件循环的共享 HTTP 会话"""
+    session = _http_sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
 class AIProviderType(Enum):
     """AI服务提供商类型"""
     OLLAMA = "ollama"
@@ -112,19 +131,20 @@ class OllamaClient(BaseAIClient):
     async def get_available_models(self) -> List[str]:
         """获取Ollama可用模型列表"""
         try:
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
-                async with session.get(f"{self.config.base_url}/api/tags") as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        models = []
-                        for model in data.get('models', []):
-                            model_name = model.get('name', '')
-                            if model_name and model_name not in models:
-                                models.append(model_name)
-                        return sorted(models)
-                    else:
-                        logger.warning(f"获取Ollama模型列表失败: HTTP {response.status}")
-                        return []
+            session = get_http_session()
+            timeout = aiohttp.ClientTimeout(total=10)
+            async with session.get(f"{self.config.base_url}/api/tags", timeout=timeout) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    models = []
+                    for model in data.get('models', []):
+                        model_name = model.get('name', '')
+                        if model_name and model_name not in models:
+                            models.append(model_name)
+                    return sorted(models)
+                else:
+                    logger.warning(f"获取Ollama模型列表失败: HTTP {response.status}")
+                    return []
         except Exception as e:
             logger.error(f"获取Ollama模型列表失败: {e}")
             return []
@@ -132,30 +152,31 @@ class OllamaClient(BaseAIClient):
     async def generate_text(self, prompt: str, system_prompt: str = "") -> str:
         """生成文本"""
         try:
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.config.timeout)) as session:
-                payload = {
-                    "model": self.config.model,
-                    "prompt": prompt,
-                    "system": system_prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": self.config.temperature,
-                        "num_predict": self.config.max_tokens
-                    }
+            session = get_http_session()
+            timeout = aiohttp.ClientTimeout(total=self.config.timeout)
+            payload = {
+                "model": self.config.model,
+                "prompt": prompt,
+                "system": system_prompt,
+                "stream": False,
+                "options": {
+                    "temperature": self.config.temperature,
+                    "num_predict": self.config.max_tokens
                 }
-                
-                # 添加额外参数
-                if self.config.extra_params:
-                    payload["options"].update(self.config.extra_params)
-                
-                async with session.post(f"{self.config.base_url}/api/generate", json=payload) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result.get("response", "")
-                    else:
-                        error_text = await response.text()
-                        raise Exception(f"Ollama API error {response.status}: {error_text}")
-                        
+            }
+            
+            # 添加额外参数
+            if self.config.extra_params:
+                payload["options"].update(self.config.extra_params)
+            
+            async with session.post(f"{self.config.base_url}/api/generate", json=payload, timeout=timeout) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    return result.get("response", "")
+                else:
+                    error_text = await response.text()
+                    raise Exception(f"Ollama API error {response.status}: {error_text}")
+                    
         except asyncio.TimeoutError:
             raise Exception(f"Ollama API timeout after {self.config.timeout}s")
         except Exception as e:
@@ -200,70 +221,71 @@ class OllamaClient(BaseAIClient):
 }"""
 
         try:
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.config.timeout)) as session:
-                payload = {
-                    "model": self.config.model,
-                    "prompt": f"""请评估这张图像的质量。
+            session = get_http_session()
+            timeout = aiohttp.ClientTimeout(total=self.config.timeout)
+            payload = {
+                "model": self.config.model,
+                "prompt": f"""请评估这张图像的质量。
 
 **原始提示词**: {original_prompt}
 
 请特别关注图像与原始提示词的匹配度，按照系统提示的格式返回JSON评估结果。""",
-                    "system": system_prompt,
-                    "images": [image_base64],  # Ollama 视觉 API 格式
-                    "stream": False
-                }
-                
-                async with session.post(f"{self.config.base_url}/api/generate", json=payload) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        response_text = result.get("response", "")
+                "system": system_prompt,
+                "images": [image_base64],  # Ollama 视觉 API 格式
+                "stream": False
+            }
+            
+            async with session.post(f"{self.config.base_url}/api/generate", json=payload, timeout=timeout) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    response_text = result.get("response", "")
+                    
+                    # 尝试解析JSON响应
+                    try:
+                        import json
+                        import re
                         
-                        # 尝试解析JSON响应
-                        try:
-                            import json
-                            import re
+                        # 提取JSON部分
+                        json_start = response_text.find('{')
+                        json_end = response_text.rfind('}') + 1
+                        if json_start >= 0 and json_end > json_start:
+                            json_str = response_text[json_start:json_end]
                             
-                            # 提取JSON部分
-                            json_start = response_text.find('{')
-                            json_end = response_text.rfind('}') + 1
-                            if json_start >= 0 and json_end > json_start:
-                                json_str = response_text[json_start:json_end]
-                                
-                                # 清理JSON字符串
-                                json_str = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F-\x9F]', '', json_str)
-                                evaluation = json.loads(json_str)
-                                
-                                # 确保评分在合理范围内
-                                raw_score = evaluation.get("score", 0)
-                                final_score = float(raw_score)
-                                if final_score > 10:
-                                    final_score = final_score / 10
-                                final_score = max(0, min(10, final_score))
-                                
-                                return {
-                                    'score': final_score,
-                                    'feedback': evaluation.get("feedback", ""),
-                                    'suggestions': evaluation.get("suggestions", []),
-                                    'defects_found': evaluation.get("defects_found", []),
-                                    'consistency_issues': evaluation.get("consistency_issues", []),
-                                    'original_prompt_accuracy': float(evaluation.get("original_prompt_accuracy", final_score))
-                                }
-                        except (json.JSONDecodeError, ValueError) as e:
-                            logger.warning(f"JSON解析失败: {e}")
-                        
-                        # 如果无法解析JSON，返回默认评估
-                        return {
-                            'score': 7.0,
-                            'feedback': f'图像质量评估完成，但响应格式解析失败: {response_text[:100]}...',
-                            'suggestions': [],
-                            'defects_found': [],
-                            'consistency_issues': [],
-                            'original_prompt_accuracy': 7.0
-                        }
-                    else:
-                        error_text = await response.text()
-                        raise Exception(f"Ollama vision API error {response.status}: {error_text}")
-                        
+                            # 清理JSON字符串
+                            json_str = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F-\x9F]', '', json_str)
+                            evaluation = json.loads(json_str)
+                            
+                            # 确保评分在合理范围内
+                            raw_score = evaluation.get("score", 0)
+                            final_score = float(raw_score)
+                            if final_score > 10:
+                                final_score = final_score / 10
+                            final_score = max(0, min(10, final_score))
+                            
+                            return {
+                                'score': final_score,
+                                'feedback': evaluation.get("feedback", ""),
+                                'suggestions': evaluation.get("suggestions", []),
+                                'defects_found': evaluation.get("defects_found", []),
+                                'consistency_issues': evaluation.get("consistency_issues", []),
+                                'original_prompt_accuracy': float(evaluation.get("original_prompt_accuracy", final_score))
+                            }
+                    except (json.JSONDecodeError, ValueError) as e:
+                        logger.warning(f"JSON解析失败: {e}")
+                    
+                    # 如果无法解析JSON，返回默认评估
+                    return {
+                        'score': 7.0,
+                        'feedback': f'图像质量评估完成，但响应格式解析失败: {response_text[:100]}...',
+                        'suggestions': [],
+                        'defects_found': [],
+                        'consistency_issues': [],
+                        'original_prompt_accuracy': 7.0
+                    }
+                else:
+                    error_text = await response.text()
+                    raise Exception(f"Ollama vision API error {response.status}: {error_text}")
+                    
         except Exception as e:
             logger.error(f"Ollama image evaluation error: {e}")
             # 返回默认评估结果
@@ -282,34 +304,35 @@ class OpenRouterClient(BaseAIClient):
     async def get_available_models(self) -> List[str]:
         """获取OpenRouter可用模型列表"""
         try:
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=15)) as session:
-                headers = {
-                    "Authorization": f"Bearer {self.config.api_key}" if self.config.api_key else "",
-                    "Content-Type": "application/json",
-                    "HTTP-Referer": "https://github.com/yourusername/ai-image-tree",
-                    "X-Title": "AI Image Tree System"
-                }
-                
-                async with session.get(f"{self.config.base_url}/api/v1/models", headers=headers) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        models = []
-                        for model in data.get('data', []):
-                            model_id = model.get('id', '')
-                            if model_id:
-                                models.append(model_id)
-                        return sorted(models)
-                    else:
-                        logger.warning(f"获取OpenRouter模型列表失败: HTTP {response.status}")
-                        # 返回默认模型列表
-                        return [
-                            "anthropic/claude-3.5-sonnet",
-                            "openai/gpt-4o",
-                            "openai/gpt-4o-mini",
-                            "google/gemini-pro-1.5",
-                            "meta-llama/llama-3.1-70b-instruct",
-                            "mistralai/mistral-7b-instruct"
-                        ]
+            session = get_http_session()
+            timeout = aiohttp.ClientTimeout(total=15)
+            headers = {
+                "Authorization": f"Bearer {self.config.api_key}" if self.config.api_key else "",
+                "Content-Type": "application/json",
+                "HTTP-Referer": "https://github.com/yourusername/ai-image-tree",
+                "X-Title": "AI Image Tree System"
+            }
+            
+            async with session.get(f"{self.config.base_url}/api/v1/models", headers=headers, timeout=timeout) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    models = []
+                    for model in data.get('data', []):
+                        model_id = model.get('id', '')
+                        if model_id:
+                            models.append(model_id)
+                    return sorted(models)
+                else:
+                    logger.warning(f"获取OpenRouter模型列表失败: HTTP {response.status}")
+                    # 返回默认模型列表
+                    return [
+                        "anthropic/claude-3.5-sonnet",
+                        "openai/gpt-4o",
+                        "openai/gpt-4o-mini",
+                        "google/gemini-pro-1.5",
+                        "meta-llama/llama-3.1-70b-instruct",
+                        "mistralai/mistral-7b-instruct"
+                    ]
         except Exception as e:
             logger.error(f"获取OpenRouter模型列表失败: {e}")
             # 返回默认模型列表
@@ -325,40 +348,41 @@ class OpenRouterClient(BaseAIClient):
     async def generate_text(self, prompt: str, system_prompt: str = "") -> str:
         """生成文本"""
         try:
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.config.timeout)) as session:
-                headers = {
-                    "Authorization": f"Bearer {self.config.api_key}",
-                    "Content-Type": "application/json",
-                    "HTTP-Referer": "https://github.com/yourusername/ai-image-tree",
-                    "X-Title": "AI Image Tree System"
-                }
-                
-                messages = []
-                if system_prompt:
-                    messages.append({"role": "system", "content": system_prompt})
-                messages.append({"role": "user", "content": prompt})
-                
-                payload = {
-                    "model": self.config.model,
-                    "messages": messages,
-                    "max_tokens": self.config.max_tokens,
-                    "temperature": self.config.temperature,
-                    "stream": False
-                }
-                
-                # 添加额外参数
-                if self.config.extra_params:
-                    payload.update(self.config.extra_params)
-                
-                async with session.post(f"{self.config.base_url}/api/v1/chat/completions", 
-                                      json=payload, headers=headers) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result["choices"][0]["message"]["content"]
-                    else:
-                        error_text = await response.text()
-                        raise Exception(f"OpenRouter API error {response.status}: {error_text}")
-                        
+            session = get_http_session()
+            timeout = aiohttp.ClientTimeout(total=self.config.timeout)
+            headers = {
+                "Authorization": f"Bearer {self.config.api_key}",
+                "Content-Type": "application/json",
+                "HTTP-Referer": "https://github.com/yourusername/ai-image-tree",
+                "X-Title": "AI Image Tree System"
+            }
+            
+            messages = []
+            if system_prompt:
+                messages.append({"role": "system", "content": system_prompt})
+            messages.append({"role": "user", "content": prompt})
+            
+            payload = {
+                "model": self.config.model,
+                "messages": messages,
+                "max_tokens": self.config.max_tokens,
+                "temperature": self.config.temperature,
+                "stream": False
+            }
+            
+            # 添加额外参数
+            if self.config.extra_params:
+                payload.update(self.config.extra_params)
+            
+            async with session.post(f"{self.config.base_url}/api/v1/chat/completions", 
+                                  json=payload, headers=headers, timeout=timeout) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    return result["choices"][0]["message"]["content"]
+                else:
+                    error_text = await response.text()
+                    raise Exception(f"OpenRouter API error {response.status}: {error_text}")
+                    
         except asyncio.TimeoutError:
             raise Exception(f"OpenRouter API timeout after {self.config.timeout}s")
         except Exception as e:
@@ -371,31 +395,32 @@ class OpenAICompatibleClient(BaseAIClient):
     async def get_available_models(self) -> List[str]:
         """获取OpenAI兼容API可用模型列表"""
         try:
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
-                headers = {
-                    "Content-Type": "application/json"
-                }
-                
-                # 如果有API密钥，添加认证头
-                if self.config.api_key:
-                    headers["Authorization"] = f"Bearer {self.config.api_key}"
-                
-                async with session.get(f"{self.config.base_url}/v1/models", headers=headers) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        models = []
-                        for model in data.get('data', []):
-                            model_id = model.get('id', '')
-                            if model_id:
-                                models.append(model_id)
-                        return sorted(models)
+            session = get_http_session()
+            timeout = aiohttp.ClientTimeout(total=10)
+            headers = {
+                "Content-Type": "application/json"
+            }
+            
+            # 如果有API密钥，添加认证头
+            if self.config.api_key:
+                headers["Authorization"] = f"Bearer {self.config.api_key}"
+            
+            async with session.get(f"{self.config.base_url}/v1/models", headers=headers, timeout=timeout) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    models = []
+                    for model in data.get('data', []):
+                        model_id = model.get('id', '')
+                        if model_id:
+                            models.append(model_id)
+                    return sorted(models)
+                else:
+                    logger.warning(f"获取OpenAI兼容API模型列表失败: HTTP {response.status}")
+                    # 如果是OpenAI官方API，返回已知模型
+                    if "api.openai.com" in self.config.base_url:
+                        return ["gpt-4o", "gpt-4o-mini", "gpt-3.5-turbo"]
                     else:
-                        logger.warning(f"获取OpenAI兼容API模型列表失败: HTTP {response.status}")
-                        # 如果是OpenAI官方API，返回已知模型
-                        if "api.openai.com" in self.config.base_url:
-                            return ["gpt-4o", "gpt-4o-mini", "gpt-3.5-turbo"]
-                        else:
-                            return ["custom-model"]
+                        return ["custom-model"]
         except Exception as e:
             logger.error(f"获取OpenAI兼容API模型列表失败: {e}")
             # 如果是OpenAI官方API，返回已知模型
@@ -407,41 +432,42 @@ class OpenAICompatibleClient(BaseAIClient):
     async def generate_text(self, prompt: str, system_prompt: str = "") -> str:
         """生成文本"""
         try:
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.config.timeout)) as session:
-                headers = {
-                    "Content-Type": "application/json"
-                }
-                
-                # 如果有API密钥，添加认证头
-                if self.config.api_key:
-                    headers["Authorization"] = f"Bearer {self.config.api_key}"
-                
-                messages = []
-                if system_prompt:
-                    messages.append({"role": "system", "content": system_prompt})
-                messages.append({"role": "user", "content": prompt})
-                
-                payload = {
-                    "model": self.config.model,
-                    "messages": messages,
-                    "max_tokens": self.config.max_tokens,
-                    "temperature": self.config.temperature,
-                    "stream": False
-                }
-                
-                # 添加额外参数
-                if self.config.extra_params:
-                    payload.update(self.config.extra_params)
-                
-                async with session.post(f"{self.config.base_url}/v1/chat/completions", 
-                                      json=payload, headers=headers) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result["choices"][0]["message"]["content"]
-                    else:
-                        error_text = await response.text()
-                        raise Exception(f"OpenAI Compatible API error {response.status}: {error_text}")
-                        
+            session = get_http_session()
+            timeout = aiohttp.ClientTimeout(total=self.config.timeout)
+            headers = {
+                "Content-Type": "application/json"
+            }
+            
+            # 如果有API密钥，添加认证头
+            if self.config.api_key:
+                headers["Authorization"] = f"Bearer {self.config.api_key}"
+            
+            messages = []
+            if system_prompt:
+                messages.append({"role": "system", "content": system_prompt})
+            messages.append({"role": "user", "content": prompt})
+            
+            payload = {
+                "model": self.config.model,
+                "messages": messages,
+                "max_tokens": self.config.max_tokens,
+                "temperature": self.config.temperature,
+                "stream": False
+            }
+            
+            # 添加额外参数
+            if self.config.extra_params:
+                payload.update(self.config.extra_params)
+            
+            async with session.post(f"{self.config.base_url}/v1/chat/completions", 
+                                  json=payload, headers=headers, timeout=timeout) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    return result["choices"][0]["message"]["content"]
+                else:
+                    error_text = await response.text()
+                    raise Exception(f"OpenAI Compatible API error {response.status}: {error_text}")
+                    
         except asyncio.TimeoutError:
             raise Exception(f"OpenAI Compatible API timeout after {self.config.timeout}s")
         except Exception as e:
@@ -51,6 +51,20 @@ def analyze_database(db_path='tree_generator.db'):
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
     
+    # 关键词缓存运行时在内存中，退出时保存到 <数据库名>.keywords.db
+    keyword_cache_path = Path(db_path).with_suffix('.keywords.db')
+    cursor.execute("ATTACH DATABASE ? AS kc",
+                   (str(keyword_cache_path) if keyword_cache_path.exists() else ':memory:',))
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS kc.keyword_cache (
+            prompt_hash BLOB PRIMARY KEY,
+            prompt TEXT NOT NULL,
+            keywords TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            usage_count INTEGER DEFAULT 1
+        )
+    """)
+    
     # 1. 分析各表的记录数和大小
     print("\n" + "="*80)
     print("📊 表结构分析")
@@ -100,10 +114,10 @@ def analyze_database(db_path='tree_generator.db'):
     print("="*80)
     
     # 统计有图像数据的节点
-    cursor.execute("SELECT COUNT(*) FROM nodes WHERE image_data IS NOT NULL")
+    cursor.execute("SELECT COUNT(*) FROM nodes WHERE node_id IN (SELECT node_id FROM node_images)")
     nodes_with_images = cursor.fetchone()[0]
     
-    cursor.execute("SELECT COUNT(*) FROM nodes WHERE image_data IS NULL")
+    cursor.execute("SELECT COUNT(*) FROM nodes WHERE node_id NOT IN (SELECT node_id FROM node_images)")
     nodes_without_images = cursor.fetchone()[0]
     
     print(f"\n节点总数: {nodes_with_images + nodes_without_images:,}")
@@ -111,7 +125,8 @@ def analyze_database(db_path='tree_generator.db'):
     print(f"  - 无图像数据: {nodes_without_images:,}")
     
     # 计算图像数据总大小
-    cursor.execute("SELECT SUM(LENGTH(image_data)) FROM nodes WHERE image_data IS NOT NULL")
+    # 图像数据存放在 node_images 表（原始字节）
+    cursor.execute("SELECT SUM(LENGTH(image_data)) FROM node_images")
     result = cursor.fetchone()
     image_data_size = result[0] if result[0] else 0
     
@@ -151,10 +166,10 @@ def analyze_database(db_path='tree_generator.db'):
     print("🔍 keyword_cache表分析")
     print("="*80)
     
-    cursor.execute("SELECT COUNT(*) FROM keyword_cache")
+    cursor.execute("SELECT COUNT(*) FROM kc.keyword_cache")
     cache_count = cursor.fetchone()[0]
     
-    cursor.execute("SELECT SUM(LENGTH(keywords)) FROM keyword_cache")
+    cursor.execute("SELECT SUM(LENGTH(keywords)) FROM kc.keyword_cache")
     result = cursor.fetchone()
     cache_size = result[0] if result[0] else 0
     
@@ -168,7 +183,7 @@ def analyze_database(db_path='tree_generator.db'):
             COUNT(*) as count,
             SUM(CASE WHEN usage_count = 1 THEN 1 ELSE 0 END) as single_use,
             SUM(CASE WHEN usage_count > 1 THEN 1 ELSE 0 END) as multi_use
-        FROM keyword_cache
+        FROM kc.keyword_cache
     """)
     result = cursor.fetchone()
     if result:
@@ -303,24 +318,24 @@ def analyze_database(db_path='tree_generator.db'):
     
     if image_data_size > total_size * 0.5:
         suggestions.append("⚠️ 图像数据占比超过50%，建议清理旧图像数据")
-        suggestions.append("   命令: python db_maintenance.py --cleanup-images 7")
+        suggestions.append("   命令: python db_maintenance.py cleanup-images 7")
     
     if freelist_count > page_count * 0.1:
         suggestions.append("⚠️ 空闲空间超过10%，建议执行VACUUM优化")
-        suggestions.append("   命令: python db_maintenance.py --vacuum")
+        suggestions.append("   命令: python db_maintenance.py vacuum")
     
     if cache_count > 1000:
-        cursor.execute("SELECT COUNT(*) FROM keyword_cache WHERE usage_count = 1")
+        cursor.execute("SELECT COUNT(*) FROM kc.keyword_cache WHERE usage_count = 1")
         single_use = cursor.fetchone()[0]
         if single_use > cache_count * 0.5:
             suggestions.append("⚠️ 超过50%的缓存仅使用1次，建议清理")
-            suggestions.append("   命令: python db_maintenance.py --cleanup-old 30")
+            suggestions.append("   命令: python db_maintenance.py cleanup-old 30")
     
     cursor.execute("SELECT COUNT(*) FROM generation_tasks WHERE status = 'failed'")
     failed_tasks = cursor.fetchone()[0]
     if failed_tasks > 0:
         suggestions.append(f"⚠️ 有 {failed_tasks} 个失败任务，建议清理")
-        suggestions.append("   命令: python db_maintenance.py --cleanup-failed")
+        suggestions.append("   命令: python db_maintenance.py cleanup-failed")
     
     if not suggestions:
         suggestions.append("✅ 数据库状态良好，暂无优化建议")
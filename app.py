@@ -48,21 +48,39 @@ if sys.platform.startswith('win'):
         print(f"Warning: Failed to set UTF-8 encoding: {e}")
         pass
 
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response
+from flask.json.provider import JSONProvider
 import asyncio
-import aiohttp
 import json
 import base64
+import io
 import uuid
 from datetime import datetime
 from pathlib import Path
 import threading
+import queue
+import functools
+import atexit
 from concurrent.futures import ThreadPoolExecutor
 import logging
 import time
+import gzip
+import hashlib
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None  # 未安装 Pillow 时不生成缩略图，缩略图接口回退为原图
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # 未安装 orjson 时使用 Flask 默认的 JSON 序列化
 
 from auto_image_generator import AutoImageGenerator, GenerationConfig
-from ai_client import AIClientFactory, AIProviderConfig, AIProviderType, PROVIDER_TEMPLATES
+from ai_client import AIClientFactory, AIProviderConfig, AIProviderType, PROVIDER_TEMPLATES, get_http_session, close_http_session
 from database import db
 from i18n_utils import i18n, t, get_locale, set_locale, register_i18n_functions
 
@@ -73,6 +91,23 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
 
+class OrjsonProvider(JSONProvider):
+    """基于 orjson 的 JSON 序列化，所有 jsonify 调用自动使用"""
+    
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+if orjson is not None:
+    app.json_provider_class = OrjsonProvider
+    app.json = OrjsonProvider(app)
+else:
+    # 默认序列化器：不排序键、紧凑输出，减少序列化开销与响应体积
+    app.json.sort_keys = False
+    app.json.compact = True
+
 # 注册国际化函数
 register_i18n_functions(app)
 
@@ -285,8 +320,243 @@ def update_generator_config():
     generator.config = new_config
     logger.info(f"生成器配置已更新: skip_quality_evaluation={new_config.skip_quality_evaluation}")
 
-# 线程池用于异步处理
-executor = ThreadPoolExecutor(max_workers=4)
+# 线程池用于异步处理（图像生成等长任务）
+executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='generate')
+
+# 关键词提取专用线程池：提取是用户等待的短任务，不能排在耗时的图像生成后面
+keyword_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='keywords')
+
+class BurstScheduler:
+    """带突发缓冲的后台任务调度器
+
+    主队列有界；主队列满时任务进入溢出缓冲，按后进先出处理（优先服务最新请求），
+    在溢出缓冲中等待超过 ttl 秒的任务会被丢弃。两者都满时拒绝提交，由调用方返回 503。
+    """
+    
+    def __init__(self, name: str, workers: int, queue_size: int, overflow_size: int, ttl: float):
+        self._queue_size = queue_size
+        self._overflow_size = overflow_size
+        self._ttl = ttl
+        self._primary = deque()   # (提交时间, 任务函数, 过期回调)
+        self._overflow = deque()
+        self._cond = threading.Condition()
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f'{name}-{i}', daemon=True).start()
+    
+    def submit(self, func, on_expire=None) -> bool:
+        """提交任务，队列和溢出缓冲都已满时返回 False"""
+        item = (time.monotonic(), func, on_expire)
+        with self._cond:
+            expired = self._pop_expired()
+            if len(self._primary) < self._queue_size:
+                self._primary.append(item)
+                accepted = True
+            elif len(self._overflow) < self._overflow_size:
+                self._overflow.append(item)
+                accepted = True
+            else:
+                accepted = False
+            if accepted:
+                self._cond.notify()
+        self._expire(expired)
+        return accepted
+    
+    def metrics(self) -> dict:
+        """队列指标"""
+        with self._cond:
+            submit_times = [item[0] for item in self._primary] + [item[0] for item in self._overflow]
+            primary_depth = len(self._primary)
+            overflow_depth = len(self._overflow)
+        
+        now = time.monotonic()
+        return {
+            'queue_depth': primary_depth,
+            'overflow_depth': overflow_depth,
+            'max_queue_depth': self._queue_size,
+            'max_overflow_depth': self._overflow_size,
+            'oldest_pending_age': round(now - min(submit_times), 3) if submit_times else 0.0
+        }
+    
+    def _pop_expired(self) -> list:
+        """取出溢出缓冲中已过期的任务（调用方持有锁）；缓冲按提交时间排列，过期的都在左端"""
+        expired = []
+        now = time.monotonic()
+        while self._overflow and now - self._overflow[0][0] > self._ttl:
+            expired.append(self._overflow.popleft())
+        return expired
+    
+    def _expire(self, expired: list):
+        for _, _, on_expire in expired:
+            if on_expire is not None:
+                try:
+                    on_expire()
+                except Exception as e:
+                    logger.error(f"处理过期任务失败: {e}")
+    
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    expired = self._pop_expired()
+                    if self._primary:
+                        item = self._primary.popleft()
+                    elif self._overflow:
+                        item = self._overflow.pop()  # 后进先出
+                    else:
+                        item = None
+                    if item is not None or expired:
+                        break
+                    self._cond.wait()
+            
+            self._expire(expired)
+            if item is None:
+                continue
+            try:
+                item[1]()
+            except Exception as e:
+                logger.error(f"后台任务执行失败: {e}")
+
+# 批量关键词提取调度器：短时突发进入溢出缓冲排队，持续过载才返回 503
+extract_scheduler = BurstScheduler('extract', workers=2, queue_size=8, overflow_size=16, ttl=120)
+
+# 批量提取关键词时同时进行的模型请求数
+KEYWORD_EXTRACT_CONCURRENCY = 4
+# 每次模型请求最多合并的提示词条数，以及每条提示词的关键词输出预估占用的 token 数；
+# 实际条数按当前模型的 max_tokens 计算，避免批量输出被截断
+KEYWORD_BATCH_SIZE = 8
+KEYWORD_TOKENS_PER_PROMPT = 1000
+
+def keyword_batch_size() -> int:
+    """按当前 AI 客户端的 max_tokens 计算每次模型请求合并的提示词条数"""
+    max_tokens = ai_client.config.max_tokens or 4000
+    return max(1, min(KEYWORD_BATCH_SIZE, max_tokens // KEYWORD_TOKENS_PER_PROMPT))
+
+# 任务进度订阅：任务ID -> 订阅者队列列表（供 SSE 推送）
+_task_subscribers = {}
+_task_subscribers_lock = threading.Lock()
+
+# 任务结束状态，推送后关闭事件流
+TASK_FINAL_STATUSES = ('completed', 'failed')
+
+# 进行中任务的内存进度：任务ID -> 最新状态，中间进度只保存在这里，不写数据库
+_task_progress = {}
+
+def get_task_progress(task_id: str):
+    """获取进行中任务的内存状态，没有时返回 None（调用方回退到数据库）"""
+    with _task_subscribers_lock:
+        return _task_progress.get(task_id)
+
+def publish_task_event(task_id: str, status: str, result=None, error: str = None):
+    """记录任务最新状态并向订阅该任务的事件流推送"""
+    event = {'status': status, 'result': result, 'error': error}
+    with _task_subscribers_lock:
+        if status in TASK_FINAL_STATUSES:
+            _task_progress.pop(task_id, None)
+        else:
+            _task_progress[task_id] = event
+        subscribers = list(_task_subscribers.get(task_id, ()))
+    
+    for subscriber in subscribers:
+        subscriber.put(event)
+
+def busy_response():
+    """后台任务队列已满时的响应"""
+    return jsonify({'success': False, 'error': '服务器繁忙，请稍后重试'}), 503, {'Retry-After': '5'}
+
+# 专用磁盘写入线程，图像落盘不占用生成线程；单线程保证同一节点的写入按提交顺序完成
+io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-io')
+# 缩略图编码较慢，放在单独的线程中，不拖慢排在后面的原图写入
+thumbnail_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-thumb')
+
+# 已创建过的树文件夹，避免每次生成都执行 mkdir
+_known_tree_folders = set()
+
+def get_tree_folder(tree_id: str) -> Path:
+    """获取树的图像文件夹，首次使用时创建"""
+    tree_folder = Path(generation_config.output_dir) / f"tree_{tree_id}"
+    if tree_id not in _known_tree_folders:
+        tree_folder.mkdir(parents=True, exist_ok=True)
+        _known_tree_folders.add(tree_id)
+    return tree_folder
+
+def _write_image_file(filepath: Path, image_data: bytes):
+    """使用 os.write 一次性写入图像文件，绕过Python层缓冲"""
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+    try:
+        fd = os.open(filepath, flags, 0o644)
+    except FileNotFoundError:
+        # 文件夹可能已被外部删除（如维护工具），重新创建后再写入
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(filepath, flags, 0o644)
+
+    try:
+        view = memoryview(image_data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+    finally:
+        os.close(fd)
+
+THUMBNAIL_WIDTH = 256
+
+def get_thumbnail_path(image_path) -> Path:
+    """缩略图与原图放在同一目录：image_xxx.png -> image_xxx.thumb.jpg"""
+    return Path(image_path).with_suffix('.thumb.jpg')
+
+def _write_thumbnail(filepath: Path):
+    """生成 256 像素宽的 JPEG 缩略图，供树视图使用"""
+    try:
+        with Image.open(filepath) as img:
+            img = img.convert('RGB')
+            height = max(1, round(img.height * THUMBNAIL_WIDTH / img.width))
+            img.thumbnail((THUMBNAIL_WIDTH, height))
+            img.save(get_thumbnail_path(filepath), 'JPEG', quality=85)
+    except Exception as e:
+        logger.warning(f"生成缩略图失败 {filepath}: {e}")
+
+def save_image_file(filepath: Path, image_data: bytes, on_written=None):
+    """提交图像写入任务到磁盘写入线程，返回 Future
+
+    调用方不必等待写入：写入成功后在写入线程中调用 on_written()（如记录 image_path），
+    再把缩略图交给缩略图线程生成。
+    """
+    def written(future):
+        error = future.exception()
+        if error is not None:
+            logger.error(f"写入图像文件失败 {filepath}: {error}")
+            return
+        if on_written is not None:
+            try:
+                on_written()
+            except Exception as e:
+                logger.error(f"记录图像文件路径失败 {filepath}: {e}")
+        if Image is not None:
+            thumbnail_executor.submit(_write_thumbnail, filepath)
+    
+    future = io_executor.submit(_write_image_file, filepath, image_data)
+    future.add_done_callback(written)
+    return future
+
+def remove_image_file(image_path):
+    """删除图像文件及其缩略图"""
+    for path in (Path(image_path), get_thumbnail_path(image_path)):
+        if path.exists():
+            path.unlink()
+
+def to_light_node(node: dict) -> dict:
+    """转换为轻量节点数据：去掉内嵌图像，改为图像地址"""
+    light = {k: v for k, v in node.items() if k != 'image_data'}
+    has_image = bool(node.get('image_path') or node.get('has_image') or node.get('image_data'))
+    light['has_image'] = has_image
+    if has_image:
+        # 文件名随每次生成变化，作为版本号使浏览器长期缓存安全失效
+        version = Path(node['image_path']).name if node.get('image_path') else 'db'
+        light['image_url'] = f"/api/node_image/{node['node_id']}.png?v={version}"
+        light['thumb_url'] = f"/api/node_thumb/{node['node_id']}.jpg?v={version}"
+    else:
+        light['image_url'] = None
+        light['thumb_url'] = None
+    return light
 
 class GenerationNode:
     """生成树节点"""
@@ -391,30 +661,29 @@ class GenerationTree:
 async def get_ollama_models(ollama_url: str) -> list:
     """获取 Ollama 服务器上可用的模型列表"""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{ollama_url.rstrip('/')}/api/tags") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    models = []
-                    for model in data.get('models', []):
-                        model_name = model.get('name', '')
-                        if model_name:
-                            # 保留完整的模型名称，包括版本标签
-                            # 例如：ministral-3:latest 保持为 ministral-3:latest
-                            # MartinRizzo/Regent-Dominique:latest 保持为 MartinRizzo/Regent-Dominique:latest
-                            if model_name not in models:
-                                models.append(model_name)
-                    return sorted(models)
-                else:
-                    logger.warning(f"获取 Ollama 模型列表失败: HTTP {response.status}")
-                    return []
+        session = get_http_session()
+        async with session.get(f"{ollama_url.rstrip('/')}/api/tags") as response:
+            if response.status == 200:
+                data = await response.json()
+                models = []
+                for model in data.get('models', []):
+                    model_name = model.get('name', '')
+                    if model_name:
+                        # 保留完整的模型名称，包括版本标签
+                        # 例如：ministral-3:latest 保持为 ministral-3:latest
+                        # MartinRizzo/Regent-Dominique:latest 保持为 MartinRizzo/Regent-Dominique:latest
+                        if model_name not in models:
+                            models.append(model_name)
+                return sorted(models)
+            else:
+                logger.warning(f"获取 Ollama 模型列表失败: HTTP {response.status}")
+                return []
     except Exception as e:
         logger.error(f"获取 Ollama 模型列表失败: {e}")
         return []
 
-async def extract_keywords_force(prompt: str) -> list:
-    """强制提取提示词关键点 - 绕过缓存机制"""
-    system_prompt = """你是一个专业的视觉化关键词分析专家，专门为AI图像生成模型提取最适合的关键词。请从给定的提示词中提取8-10个具有强烈视觉表现力的关键要素。
+# 关键词提取的系统提示词（单条与批量提取共用）
+KEYWORD_SYSTEM_PROMPT = """你是一个专业的视觉化关键词分析专家，专门为AI图像生成模型提取最适合的关键词。请从给定的提示词中提取8-10个具有强烈视觉表现力的关键要素。
 
 **核心原则：优先选择容易视觉化、具体可画的关键词**
 
@@ -464,6 +733,46 @@ async def extract_keywords_force(prompt: str) -> list:
   {"text": "自信微笑", "type": "visual_emotion", "description": "嘴角上扬的自信笑容", "visual_strength": "medium"}
 ]}"""
 
+# 批量提取时附加的输出格式要求
+KEYWORD_BATCH_INSTRUCTION = """
+现在会一次给出多条编号的提示词，请分别为每一条提取关键词，并严格按照以下JSON格式返回（index 与输入编号一致）：
+{"results": [{"index": 1, "keywords": [{"text": "关键词", "type": "类型", "description": "视觉化描述", "visual_strength": "high/medium/low"}]}]}"""
+
+async def extract_keywords_batch(prompts: list) -> list:
+    """一次模型请求为多条提示词提取关键词，返回与输入顺序一致的关键词列表
+
+    模型漏掉的条目会单独补提取。
+    """
+    numbered = "\n".join(f"{i}. {prompt}" for i, prompt in enumerate(prompts, 1))
+    keywords_by_index = {}
+    try:
+        response = await ai_client.generate_text(
+            f"请分析以下 {len(prompts)} 条提示词并分别提取关键要素：\n{numbered}",
+            KEYWORD_SYSTEM_PROMPT + KEYWORD_BATCH_INSTRUCTION
+        )
+        result = safe_json_parse(response)
+        if result and isinstance(result.get('results'), list):
+            for item in result['results']:
+                if isinstance(item, dict) and item.get('keywords'):
+                    # 模型可能把编号返回成字符串
+                    try:
+                        keywords_by_index[int(item.get('index'))] = item['keywords']
+                    except (TypeError, ValueError):
+                        continue
+    except Exception as e:
+        logger.error(f"批量关键词提取请求失败: {e}")
+    
+    missing = [i for i in range(1, len(prompts) + 1) if not keywords_by_index.get(i)]
+    if missing:
+        logger.info(f"批量结果缺少 {len(missing)}/{len(prompts)} 条，并发单独提取")
+        fallbacks = await asyncio.gather(*(extract_keywords_force(prompts[i - 1]) for i in missing))
+        keywords_by_index.update(zip(missing, fallbacks))
+    return [keywords_by_index[i] for i in range(1, len(prompts) + 1)]
+
+async def extract_keywords_force(prompt: str) -> list:
+    """强制提取提示词关键点 - 绕过缓存机制"""
+    system_prompt = KEYWORD_SYSTEM_PROMPT
+
     try:
         # 直接调用AI，不检查缓存
         response = await ai_client.generate_text(
@@ -491,55 +800,7 @@ async def extract_keywords_force(prompt: str) -> list:
 
 async def extract_keywords(prompt: str) -> list:
     """提取提示词关键点 - 专注视觉化表达和图像生成优化"""
-    system_prompt = """你是一个专业的视觉化关键词分析专家，专门为AI图像生成模型提取最适合的关键词。请从给定的提示词中提取8-10个具有强烈视觉表现力的关键要素。
-
-**核心原则：优先选择容易视觉化、具体可画的关键词**
-
-分析策略：
-1. 视觉实体：具体的物体、品种、类型（可以直接画出来的）
-2. 视觉特征：颜色、质感、形状、大小、材质
-3. 视觉场景：具体的环境、光线、时间、天气
-4. 视觉动作：姿态、表情、动作、状态
-5. 视觉风格：艺术风格、摄影技法、绘画手法
-6. 视觉情感：通过视觉元素表达的情感（而非抽象概念）
-
-关键词类型（按视觉化程度排序）：
-- visual_object: 具体视觉物体（品种、类型、物品、服装、配饰）
-- visual_feature: 视觉特征（颜色、质感、形状、材质、光线）
-- visual_scene: 视觉场景（环境、背景、时间、天气、地点）
-- visual_action: 视觉动作（姿态、表情、动作、状态）
-- visual_style: 视觉风格（艺术风格、摄影技法、构图方式）
-- visual_emotion: 视觉化情感（通过表情、姿态、色彩表达的情感）
-
-**重要提醒**：
-- 避免抽象概念（如"哲学思考"、"社会意义"、"心理状态"）
-- 优先选择有明确视觉特征的词汇
-- 关注图像生成模型容易理解的描述
-- 每个关键词都应该能够直接转化为视觉元素
-
-严格按照JSON格式返回：
-{"keywords": [{"text": "关键词", "type": "类型", "description": "视觉化描述", "visual_strength": "high/medium/low"}]}
-
-示例：
-输入："小猫"
-输出：{"keywords": [
-  {"text": "英短猫", "type": "visual_object", "description": "圆脸、短毛、蓝灰色毛发的具体猫品种", "visual_strength": "high"},
-  {"text": "毛茸茸质感", "type": "visual_feature", "description": "柔软蓬松的毛发质感，可通过细腻笔触表现", "visual_strength": "high"},
-  {"text": "蜷缩姿态", "type": "visual_action", "description": "小猫典型的睡觉姿势，身体蜷成球状", "visual_strength": "high"},
-  {"text": "粉色鼻子", "type": "visual_feature", "description": "小猫鼻子的典型颜色特征", "visual_strength": "high"},
-  {"text": "阳光窗台", "type": "visual_scene", "description": "温暖的阳光透过窗户洒在窗台上", "visual_strength": "high"},
-  {"text": "慵懒表情", "type": "visual_emotion", "description": "半闭眼睛、放松的面部表情", "visual_strength": "medium"}
-]}
-
-输入："美女"
-输出：{"keywords": [
-  {"text": "长发飘逸", "type": "visual_feature", "description": "柔顺的长发在风中飘动的视觉效果", "visual_strength": "high"},
-  {"text": "红唇", "type": "visual_feature", "description": "鲜艳的红色嘴唇，经典美女特征", "visual_strength": "high"},
-  {"text": "优雅姿态", "type": "visual_action", "description": "挺直的身姿、优美的手势", "visual_strength": "high"},
-  {"text": "丝质长裙", "type": "visual_object", "description": "光滑有光泽的丝绸材质连衣裙", "visual_strength": "high"},
-  {"text": "柔和光线", "type": "visual_scene", "description": "温暖柔和的打光效果", "visual_strength": "high"},
-  {"text": "自信微笑", "type": "visual_emotion", "description": "嘴角上扬的自信笑容", "visual_strength": "medium"}
-]}"""
+    system_prompt = KEYWORD_SYSTEM_PROMPT
 
     try:
         # 首先检查缓存
@@ -825,14 +1086,22 @@ async def generate_enhanced_prompts(original_prompt: str, selected_keywords: lis
             {"direction": "基础增强", "prompt": f"{original_prompt}，{keywords_text}"}
         ]
 
+# 常驻事件循环：所有异步调用共用一个循环，从而复用同一个 HTTP 连接池
+_async_loop = asyncio.new_event_loop()
+threading.Thread(target=_async_loop.run_forever, name='async-loop', daemon=True).start()
+
 def run_async(coro):
-    """在新的事件循环中运行异步函数"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+    """在常驻事件循环中运行异步函数并等待结果"""
+    return asyncio.run_coroutine_threadsafe(coro, _async_loop).result()
+
+@atexit.register
+def _shutdown_async_loop():
+    """退出时关闭共享 HTTP 会话并停止事件循环"""
     try:
-        return loop.run_until_complete(coro)
-    finally:
-        loop.close()
+        asyncio.run_coroutine_threadsafe(close_http_session(), _async_loop).result(timeout=5)
+    except Exception:
+        pass
+    _async_loop.call_soon_threadsafe(_async_loop.stop)
 
 def clean_json_string(text: str) -> str:
     """清理JSON字符串，移除控制字符和多余内容"""
@@ -922,7 +1191,7 @@ def get_translations(locale):
         if locale in i18n.supported_locales:
             return jsonify({
                 'success': True,
-                'translations': i18n.translations[locale],
+                'translations': i18n.get_translations(locale),
                 'locale': locale
             })
         else:
@@ -1884,7 +2153,7 @@ def create_tree():
             logger.error(f"关键词提取失败: {e}")
             db.update_task(task_id, 'failed', error=str(e))
     
-    executor.submit(extract_and_update)
+    keyword_executor.submit(extract_and_update)
     
     return jsonify({
         'tree_id': tree_id,
@@ -1905,6 +2174,11 @@ def check_task(task_id):
                 "error": "无效的任务ID"
             }), 400
         
+        # 进行中的任务优先读取内存进度
+        progress = get_task_progress(task_id)
+        if progress:
+            return jsonify(progress)
+        
         task = db.get_task(task_id)
         if not task:
             logger.warning(f"任务不存在: {task_id}")
@@ -1924,6 +2198,51 @@ def check_task(task_id):
             "error": str(e)
         }), 500
 
+@app.route('/api/task_stream/<task_id>')
+def task_stream(task_id):
+    """以 Server-Sent Events 推送任务进度，替代客户端轮询"""
+    if not db.get_task(task_id):
+        return jsonify({"status": "not_found"}), 404
+    
+    # 先注册再读取当前状态，保证期间的更新不会丢失
+    subscriber = queue.Queue()
+    with _task_subscribers_lock:
+        _task_subscribers.setdefault(task_id, []).append(subscriber)
+    
+    def format_event(event):
+        return f"data: {app.json.dumps(event)}\n\n"
+    
+    def generate():
+        try:
+            event = get_task_progress(task_id)
+            if event is None:
+                task = db.get_task(task_id)
+                event = {'status': task['status'], 'result': task['result'], 'error': task['error']}
+            yield format_event(event)
+            
+            while event['status'] not in TASK_FINAL_STATUSES:
+                try:
+                    event = subscriber.get(timeout=15)
+                except queue.Empty:
+                    # 没有推送的任务类型也能结束：超时时回查一次数据库
+                    task = db.get_task(task_id)
+                    if task and task['status'] in TASK_FINAL_STATUSES:
+                        event = {'status': task['status'], 'result': task['result'], 'error': task['error']}
+                    else:
+                        yield ": keep-alive\n\n"
+                        continue
+                yield format_event(event)
+        finally:
+            with _task_subscribers_lock:
+                subscribers = _task_subscribers.get(task_id, [])
+                if subscriber in subscribers:
+                    subscribers.remove(subscriber)
+                if not subscribers:
+                    _task_subscribers.pop(task_id, None)
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/generate_branches', methods=['POST'])
 def generate_branches():
     """生成分支节点"""
@@ -1947,25 +2266,31 @@ def generate_branches():
             # 生成增强提示词
             enhanced_prompts = run_async(generate_enhanced_prompts(parent_node['prompt'], selected_keywords))
             
-            # 创建子节点
-            child_nodes = []
-            for enhanced in enhanced_prompts:
-                child_id = db.add_node(tree_id, enhanced['prompt'], parent_id, enhanced['direction'])
-                db.update_node(child_id, status='generating')
-                child_nodes.append({
+            # 创建子节点（一次事务批量插入）
+            child_ids = db.add_nodes_bulk(
+                tree_id, parent_id,
+                [(enhanced['prompt'], enhanced['direction']) for enhanced in enhanced_prompts],
+                status='generating'
+            )
+            child_nodes = [
+                {
                     'node_id': child_id,
                     'direction': enhanced['direction'],
                     'prompt': enhanced['prompt']
-                })
-            
-            # 更新任务状态为分支创建完成
-            db.update_task(task_id, 'completed', child_nodes)
+                }
+                for child_id, enhanced in zip(child_ids, enhanced_prompts)
+            ]
             
+            # 更新任务状态为分支创建完成，并在同一事务中创建所有图像生成任务
+            image_task_ids = db.create_tasks_bulk(
+                tree_id, 'generate_image', [child['node_id'] for child in child_nodes],
+                complete_task_id=task_id, complete_result=child_nodes
+            )
+
             # 自动为每个子节点生成图像
-            for child_data in child_nodes:
+            for child_data, image_task_id in zip(child_nodes, image_task_ids):
                 child_id = child_data['node_id']
-                image_task_id = db.create_task(tree_id, 'generate_image', child_id)
-                
+
                 def generate_child_image(node_id=child_id, img_task_id=image_task_id):
                     # 获取最新的质量控制设置
                     current_quality_config = get_current_quality_config()
@@ -1991,42 +2316,43 @@ def generate_branches():
                                 
                                 if quality_check['passed'] or retry_count >= max_retries:
                                     # 质量通过或达到最大重试次数，保存图像
-                                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                                    
+                                    timestamp = int(time.time())  # 文件名后缀为 Unix 时间戳（秒）
+
                                     # 为每个树创建独立文件夹
-                                    tree_folder = Path(generation_config.output_dir) / f"tree_{tree_id}"
-                                    tree_folder.mkdir(parents=True, exist_ok=True)
-                                    
+                                    tree_folder = get_tree_folder(tree_id)
+
                                     filename = f"web_{node_id}_{timestamp}.png"
                                     filepath = tree_folder / filename
-                                    
-                                    with open(filepath, 'wb') as f:
-                                        f.write(image_data)
-                                    
+
+                                    # 磁盘写入完成后再记录路径，图像数据已先存入数据库
+                                    save_image_file(filepath, image_data, functools.partial(
+                                        db.update_node, node_id, image_path=str(filepath)))
+
                                     # 使用质量检查的评分
                                     final_quality_score = quality_check['quality_score']
                                     accuracy_score = quality_check['accuracy_score']
-                                    
+
                                     # 更新节点信息
-                                    image_data_b64 = base64.b64encode(image_data).decode('utf-8')
-                                    db.update_node(node_id, 
-                                                 image_path=str(filepath),
-                                                 image_data=image_data_b64,
+                                    db.update_node(node_id,
+                                                 image_data=image_data,
                                                  quality_score=final_quality_score,
                                                  accuracy_score=accuracy_score,
                                                  status='completed')
                                     
-                                    # 提取关键词
-                                    try:
-                                        logger.info(f"开始为节点 {node_id} 提取关键词...")
-                                        keywords = run_async(extract_keywords(final_prompt))
-                                        db.update_node(node_id, keywords=keywords)
-                                        logger.info(f"节点 {node_id} 关键词提取完成，共 {len(keywords)} 个关键词")
-                                    except Exception as kw_error:
-                                        logger.error(f"节点 {node_id} 关键词提取失败: {kw_error}")
-                                        # 使用备用关键词
-                                        backup_keywords = generate_creative_keywords(final_prompt)
-                                        db.update_node(node_id, keywords=backup_keywords)
+                                    # 提取关键词（提示词未变且已有关键词时直接复用）
+                                    if final_prompt == node_data['prompt'] and node_data['keywords']:
+                                        logger.info(f"节点 {node_id} 提示词未变化，复用已有关键词")
+                                    else:
+                                        try:
+                                            logger.info(f"开始为节点 {node_id} 提取关键词...")
+                                            keywords = run_async(extract_keywords(final_prompt))
+                                            db.update_node(node_id, keywords=keywords)
+                                            logger.info(f"节点 {node_id} 关键词提取完成，共 {len(keywords)} 个关键词")
+                                        except Exception as kw_error:
+                                            logger.error(f"节点 {node_id} 关键词提取失败: {kw_error}")
+                                            # 使用备用关键词
+                                            backup_keywords = generate_creative_keywords(final_prompt)
+                                            db.update_node(node_id, keywords=backup_keywords)
                                     
                                     db.update_task(img_task_id, 'completed', {
                                         'node_id': node_id,
@@ -2101,20 +2427,19 @@ def generate_image():
             
             if image_data:
                 # 保存图像
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                
+                timestamp = int(time.time())  # 文件名后缀为 Unix 时间戳（秒）
+
                 # 为每个树创建独立文件夹
-                tree_folder = Path(generation_config.output_dir) / f"tree_{tree_id}"
-                tree_folder.mkdir(parents=True, exist_ok=True)
-                
+                tree_folder = get_tree_folder(tree_id)
+
                 filename = f"web_{node_id}_{timestamp}.png"
                 filepath = tree_folder / filename
-                
-                with open(filepath, 'wb') as f:
-                    f.write(image_data)
-                
+
+                # 磁盘写入完成后再记录路径
+                save_image_file(filepath, image_data,
+                                functools.partial(setattr, node, 'image_path', str(filepath)))
+
                 # 更新节点信息
-                node.image_path = str(filepath)
                 node.image_data = base64.b64encode(image_data).decode('utf-8')
                 node.quality_score = quality_score
                 node.status = "completed"
@@ -2146,40 +2471,116 @@ def generate_image():
     
     return jsonify({'status': 'generating', 'task_id': task_id})
 
+# 树数据响应缓存：树ID -> (数据版本, ETag, 响应体, gzip 响应体)
+# 本进程的树/节点写入或其他进程对数据库的提交都会改变 db.data_version，版本不一致即视为失效
+TREE_CACHE_SIZE = 32
+# 响应体超过该大小（字节）的树不缓存，流式输出时也不再累积已发送的数据块
+TREE_CACHE_MAX_BYTES = 2 * 1024 * 1024
+_tree_response_cache = OrderedDict()
+_tree_cache_lock = threading.Lock()
+
+def cached_json_response(etag: str, body: bytes, gz_body: bytes = None):
+    """返回带 ETag 的 JSON 响应，客户端缓存命中时返回 304，支持时返回预压缩内容"""
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    elif gz_body is not None and 'gzip' in request.accept_encodings:
+        response = Response(gz_body, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(body, mimetype='application/json')
+    
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.cache_control.no_cache = True
+    return response
+
 @app.route('/api/get_tree/<tree_id>')
 def get_tree(tree_id):
     """获取生成树数据"""
-    tree_data = db.get_tree(tree_id)
-    if not tree_data:
+    # 在读取数据前记录版本号，期间发生的写入会使这次缓存在下次请求时失效
+    data_version = db.data_version
+    with _tree_cache_lock:
+        cached = _tree_response_cache.get(tree_id)
+        if cached and cached[0] == data_version:
+            _tree_response_cache.move_to_end(tree_id)
+        else:
+            cached = None
+    if cached:
+        return cached_json_response(*cached[1:])
+    
+    tree_info = db.get_tree_info(tree_id)
+    if not tree_info:
         return jsonify({'error': '生成树不存在'}), 404
     
-    # 自动为没有关键词的节点提取关键词
-    nodes_to_extract = []
-    for node_id, node in tree_data['nodes'].items():
-        # 如果节点有图像但没有关键词，自动提取
-        if node['image_data'] and (not node['keywords'] or len(node['keywords']) == 0):
-            nodes_to_extract.append((node_id, node['prompt']))
-    
-    # 异步提取关键词
-    if nodes_to_extract:
-        def extract_missing_keywords():
-            for node_id, prompt in nodes_to_extract:
-                try:
-                    logger.info(f"自动为节点 {node_id} 提取关键词...")
-                    keywords = run_async(extract_keywords(prompt))
-                    db.update_node(node_id, keywords=keywords)
-                    logger.info(f"节点 {node_id} 自动关键词提取完成，共 {len(keywords)} 个关键词")
-                except Exception as e:
-                    logger.error(f"节点 {node_id} 自动关键词提取失败: {e}")
-                    # 使用备用关键词
-                    backup_keywords = generate_creative_keywords(prompt)
-                    db.update_node(node_id, keywords=backup_keywords)
+    # 缓存未命中时逐个节点流式输出，不在内存中构建整棵树（含图像数据）的字典；
+    # 输出完成后把完整响应体放入缓存，之后的请求即可使用 ETag / gzip（大树除外）
+    def generate():
+        dumps = app.json.dumps
+        chunks = []
+        # 已累积的字节数；超过 TREE_CACHE_MAX_BYTES 后设为 None，不再累积也不缓存
+        cached_size = 0
+        pending = []
+        nodes_to_extract = []
         
-        # 提交后台任务
-        executor.submit(extract_missing_keywords)
-        logger.info(f"启动自动关键词提取任务，共 {len(nodes_to_extract)} 个节点")
-    
-    return jsonify(tree_data)
+        # 树信息对象去掉结尾的 "}"，接着输出 nodes 字段
+        pending.append(dumps(tree_info)[:-1] + ',"nodes":{')
+        for index, node in enumerate(db.iter_tree_nodes(tree_id)):
+            # 如果节点有图像但没有关键词，自动提取
+            if node['has_image'] and (not node['keywords'] or len(node['keywords']) == 0):
+                nodes_to_extract.append((node['node_id'], node['prompt']))
+            # 返回轻量结构，图像通过 /api/node_image 单独获取
+            separator = ',' if index else ''
+            pending.append(f"{separator}{dumps(node['node_id'])}:{dumps(to_light_node(node))}")
+            if len(pending) >= 32:
+                chunk = ''.join(pending).encode('utf-8')
+                pending.clear()
+                if cached_size is not None:
+                    cached_size += len(chunk)
+                    if cached_size > TREE_CACHE_MAX_BYTES:
+                        chunks.clear()
+                        cached_size = None
+                    else:
+                        chunks.append(chunk)
+                yield chunk
+        pending.append('}}')
+        chunk = ''.join(pending).encode('utf-8')
+        if cached_size is not None:
+            chunks.append(chunk)
+        yield chunk
+        
+        # 异步提取关键词
+        if nodes_to_extract:
+            def extract_missing_keywords():
+                for node_id, prompt in nodes_to_extract:
+                    try:
+                        logger.info(f"自动为节点 {node_id} 提取关键词...")
+                        keywords = run_async(extract_keywords(prompt))
+                        db.update_node(node_id, keywords=keywords)
+                        logger.info(f"节点 {node_id} 自动关键词提取完成，共 {len(keywords)} 个关键词")
+                    except Exception as e:
+                        logger.error(f"节点 {node_id} 自动关键词提取失败: {e}")
+                        # 使用备用关键词
+                        backup_keywords = generate_creative_keywords(prompt)
+                        db.update_node(node_id, keywords=backup_keywords)
+            
+            # 提交后台任务
+            keyword_executor.submit(extract_missing_keywords)
+            logger.info(f"启动自动关键词提取任务，共 {len(nodes_to_extract)} 个节点")
+        
+        if cached_size is None:
+            return
+        body = b''.join(chunks)
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        gz_body = gzip.compress(body, compresslevel=1) if len(body) >= 1024 else None
+        with _tree_cache_lock:
+            _tree_response_cache[tree_id] = (data_version, etag, body, gz_body)
+            _tree_response_cache.move_to_end(tree_id)
+            while len(_tree_response_cache) > TREE_CACHE_SIZE:
+                _tree_response_cache.popitem(last=False)
+    
+    response = Response(generate(), mimetype='application/json')
+    response.cache_control.no_cache = True
+    return response
 
 @app.route('/api/check_branch_images/<tree_id>/<parent_id>')
 def check_branch_images(tree_id, parent_id):
@@ -2202,7 +2603,7 @@ def check_branch_images(tree_id, parent_id):
             status_info = {
                 'node_id': child_id,
                 'status': child_node['status'],
-                'has_image': bool(child_node['image_data']),
+                'has_image': child_node['has_image'],
                 'quality_score': child_node['quality_score'],
                 'prompt': child_node['prompt'],
                 'keywords': child_node['keywords'],
@@ -2238,11 +2639,13 @@ def get_siblings(tree_id, node_id):
         if parent_node:
             for sibling_id in parent_node['children']:
                 sibling_node = tree_data['nodes'].get(sibling_id)
-                if sibling_node and sibling_node['image_data']:
+                if sibling_node and (sibling_node['image_path'] or sibling_node['has_image']):
+                    light_node = to_light_node(sibling_node)
                     siblings.append({
                         'node_id': sibling_id,
                         'prompt': sibling_node['prompt'],
-                        'image_data': sibling_node['image_data'],
+                        'image_url': light_node['image_url'],
+                        'thumb_url': light_node['thumb_url'],
                         'quality_score': sibling_node['quality_score'],
                         'branch_info': sibling_node['branch_info']
                     })
@@ -2375,50 +2778,51 @@ def regenerate_image():
                         
                         if quality_check['passed'] or retry_count >= max_retries:
                             # 质量通过或达到最大重试次数，保存图像
-                            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                            timestamp = int(time.time())  # 文件名后缀为 Unix 时间戳（秒）
                             
                             # 为每个树创建独立文件夹
-                            tree_folder = Path(generation_config.output_dir) / f"tree_{tree_id}"
-                            tree_folder.mkdir(parents=True, exist_ok=True)
-                            
+                            tree_folder = get_tree_folder(tree_id)
+
                             filename = f"regenerated_{node_id}_{timestamp}.png"
                             filepath = tree_folder / filename
                             
                             # 删除旧图像文件
-                            if node_data.get('image_path') and Path(node_data['image_path']).exists():
+                            if node_data.get('image_path'):
                                 try:
-                                    Path(node_data['image_path']).unlink()
+                                    remove_image_file(node_data['image_path'])
                                     logger.info(f"已删除旧图像文件: {node_data['image_path']}")
                                 except Exception as e:
                                     logger.warning(f"删除旧图像文件失败: {e}")
                             
-                            with open(filepath, 'wb') as f:
-                                f.write(image_data)
-                            
+                            # 磁盘写入完成后再记录路径，图像数据已先存入数据库
+                            save_image_file(filepath, image_data, functools.partial(
+                                db.update_node, node_id, image_path=str(filepath)))
+
                             # 使用质量检查的评分
                             final_quality_score = quality_check['quality_score']
                             accuracy_score = quality_check['accuracy_score']
-                            
+
                             # 更新节点信息
-                            image_data_b64 = base64.b64encode(image_data).decode('utf-8')
-                            db.update_node(node_id, 
-                                         image_path=str(filepath),
-                                         image_data=image_data_b64,
+                            db.update_node(node_id,
+                                         image_data=image_data,
                                          quality_score=final_quality_score,
                                          accuracy_score=accuracy_score,
                                          status='completed')
                             
-                            # 重新提取关键词
-                            try:
-                                logger.info(f"重新为节点 {node_id} 提取关键词...")
-                                keywords = run_async(extract_keywords(final_prompt))
-                                db.update_node(node_id, keywords=keywords)
-                                logger.info(f"节点 {node_id} 关键词重新提取完成，共 {len(keywords)} 个关键词")
-                            except Exception as kw_error:
-                                logger.error(f"节点 {node_id} 关键词重新提取失败: {kw_error}")
-                                # 使用备用关键词
-                                backup_keywords = generate_creative_keywords(final_prompt)
-                                db.update_node(node_id, keywords=backup_keywords)
+                            # 重新提取关键词（提示词未变且已有关键词时直接复用）
+                            if final_prompt == current_node_data['prompt'] and current_node_data['keywords']:
+                                logger.info(f"节点 {node_id} 提示词未变化，复用已有关键词")
+                            else:
+                                try:
+                                    logger.info(f"重新为节点 {node_id} 提取关键词...")
+                                    keywords = run_async(extract_keywords(final_prompt))
+                                    db.update_node(node_id, keywords=keywords)
+                                    logger.info(f"节点 {node_id} 关键词重新提取完成，共 {len(keywords)} 个关键词")
+                                except Exception as kw_error:
+                                    logger.error(f"节点 {node_id} 关键词重新提取失败: {kw_error}")
+                                    # 使用备用关键词
+                                    backup_keywords = generate_creative_keywords(final_prompt)
+                                    db.update_node(node_id, keywords=backup_keywords)
                             
                             db.update_task(task_id, 'completed', {
                                 'node_id': node_id,
@@ -2476,6 +2880,45 @@ def download_image(tree_id, node_id):
     
     return send_file(node_data['image_path'], as_attachment=True)
 
+# 图像地址带版本号（文件名），内容不可变，可长期缓存
+IMAGE_CACHE_MAX_AGE = 31536000
+
+def send_node_image(node_data, max_age: int):
+    """发送节点原图，文件不存在时回退到数据库中的图像数据"""
+    if node_data['image_path'] and Path(node_data['image_path']).exists():
+        return send_file(node_data['image_path'], mimetype='image/png', max_age=max_age)
+    
+    # 兼容只在数据库中保存了图像数据的旧节点
+    image_data = db.get_node_image(node_data['node_id']) if node_data['has_image'] else None
+    if image_data:
+        return send_file(io.BytesIO(image_data), mimetype='image/png', max_age=max_age)
+    
+    return jsonify({'error': '图像不存在'}), 404
+
+@app.route('/api/node_image/<node_id>.png')
+def node_image(node_id):
+    """获取节点原图"""
+    node_data = db.get_node(node_id)
+    if not node_data:
+        return jsonify({'error': '图像不存在'}), 404
+    
+    return send_node_image(node_data, IMAGE_CACHE_MAX_AGE)
+
+@app.route('/api/node_thumb/<node_id>.jpg')
+def node_thumb(node_id):
+    """获取节点缩略图"""
+    node_data = db.get_node(node_id)
+    if not node_data:
+        return jsonify({'error': '图像不存在'}), 404
+    
+    if node_data['image_path']:
+        thumb_path = get_thumbnail_path(node_data['image_path'])
+        if thumb_path.exists():
+            return send_file(thumb_path, mimetype='image/jpeg', max_age=IMAGE_CACHE_MAX_AGE)
+    
+    # 缩略图尚未生成（或未安装 Pillow）时回退为原图，且不缓存，以便之后拿到真正的缩略图
+    return send_node_image(node_data, 0)
+
 @app.route('/api/update_prompt', methods=['POST'])
 def update_prompt():
     """更新节点的提示词"""
@@ -2526,8 +2969,9 @@ def delete_tree(tree_id):
         
         # 执行删除
         success = db.delete_tree(tree_id)
-        
+
         if success:
+            _known_tree_folders.discard(tree_id)
             return jsonify({
                 'success': True,
                 'message': f'生成树 "{tree_data["nodes"][tree_data["root_id"]]["prompt"]}" 已成功删除',
@@ -2546,97 +2990,165 @@ def delete_tree(tree_id):
             'error': str(e)
         }), 500
 
+@dataclass
+class ExtractTaskResponse:
+    """批量提取任务提交成功时的响应（固定结构，由 JSON 序列化器直接处理 dataclass）"""
+    success: bool
+    task_id: str
+    message: str
+    nodes_to_extract: int
+    total_nodes: int
+    deduplicated: bool = False
+
+# 进行中的批量提取：节点集合哈希 -> 任务ID，重复提交时直接返回已有任务
+_inflight_extractions = {}
+_inflight_lock = threading.Lock()
+
+def _finish_inflight_extraction(inflight_key: str):
+    with _inflight_lock:
+        _inflight_extractions.pop(inflight_key, None)
+
 @app.route('/api/auto_extract_keywords/<tree_id>')
 def auto_extract_keywords(tree_id):
     """自动为树中缺少关键词的节点提取关键词"""
     try:
-        logger.info(f"开始批量提取关键词，树ID: {tree_id}")
+        logger.info("开始批量提取关键词，树ID: %s", tree_id)
         
         tree_data = db.get_tree(tree_id)
         if not tree_data:
-            logger.warning(f"树不存在: {tree_id}")
+            logger.warning("树不存在: %s", tree_id)
             return jsonify({'success': False, 'error': '生成树不存在'}), 404
         
         # 找到需要提取关键词的节点
         nodes_to_extract = []
         for node_id, node in tree_data['nodes'].items():
             # 如果节点有图像但没有关键词，或者关键词为空
-            if (node['image_data'] or node['status'] == 'completed') and (not node['keywords'] or len(node['keywords']) == 0):
+            if (node['has_image'] or node['status'] == 'completed') and (not node['keywords'] or len(node['keywords']) == 0):
                 nodes_to_extract.append({
                     'node_id': node_id,
                     'prompt': node['prompt'],
                     'status': node['status']
                 })
         
-        logger.info(f"找到 {len(nodes_to_extract)} 个需要提取关键词的节点")
+        n_extract = len(nodes_to_extract)
+        n_total = len(tree_data['nodes'])
+        logger.info("找到 %d 个需要提取关键词的节点", n_extract)
         
-        if not nodes_to_extract:
+        if not n_extract:
             return jsonify({
                 'success': True,
                 'message': '所有节点都已有关键词',
                 'extracted_count': 0,
                 'nodes_to_extract': 0,
-                'total_nodes': len(tree_data['nodes'])
+                'total_nodes': n_total
             })
         
-        # 创建批量关键词提取任务
-        task_id = db.create_task(tree_id, 'batch_extract_keywords', None)
-        logger.info(f"创建批量提取任务: {task_id}")
-        
-        def batch_extract_keywords():
+        # 相同节点集合的提取任务仍在进行时（如重复点击、客户端重试），直接返回已有任务
+        inflight_key = hashlib.blake2b(
+            repr(sorted(node_info['node_id'] for node_info in nodes_to_extract)).encode('utf-8'),
+            digest_size=16
+        ).hexdigest()
+        with _inflight_lock:
+            existing_task_id = _inflight_extractions.get(inflight_key)
+            if existing_task_id is None:
+                # 创建批量关键词提取任务
+                task_id = db.create_task(tree_id, 'batch_extract_keywords', None)
+                _inflight_extractions[inflight_key] = task_id
+        
+        if existing_task_id is not None:
+            logger.info("批量提取任务已在进行中，复用任务: %s", existing_task_id)
+            return jsonify(ExtractTaskResponse(
+                True, existing_task_id, f'已有任务正在为 {n_extract} 个节点提取关键词', n_extract, n_total,
+                deduplicated=True
+            ))
+        
+        logger.info("创建批量提取任务: %s", task_id)
+        
+        async def batch_extract_keywords():
+            # 在常驻事件循环中并发请求模型，节点写入放到线程中避免阻塞事件循环（任务状态更新只是入队）
+            semaphore = asyncio.Semaphore(KEYWORD_EXTRACT_CONCURRENCY)
+            extracted_count = 0
+            
+            async def extract_batch(batch):
+                nonlocal extracted_count
+                prompts = [node_info['prompt'] for node_info in batch]
+                async with semaphore:
+                    try:
+                        logger.info("批量提取关键词: %d 个节点", len(batch))
+                        keywords_list = await extract_keywords_batch(prompts)  # 强制提取，绕过缓存
+                    except Exception as e:
+                        logger.error("批量关键词提取失败，使用备用关键词: %s", e)
+                        keywords_list = [generate_creative_keywords(prompt) for prompt in prompts]
+                
+                # asyncio.to_thread 需要 Python 3.9，这里用默认线程池兼容 3.8
+                loop = asyncio.get_running_loop()
+                for node_info, keywords in zip(batch, keywords_list):
+                    await loop.run_in_executor(None, functools.partial(
+                        db.update_node, node_info['node_id'], keywords=keywords))
+                
+                # 每批更新一次任务进度（只在内存中，数据库只记录开始和结束）
+                extracted_count += len(batch)
+                publish_task_event(task_id, 'running', {
+                    'extracted_count': extracted_count,
+                    'total_nodes': n_extract
+                })
+            
             try:
-                logger.info(f"开始执行批量提取任务: {task_id}")
+                logger.info("开始执行批量提取任务: %s", task_id)
                 db.update_task(task_id, 'running')
-                extracted_count = 0
+                publish_task_event(task_id, 'running')
                 
-                for node_info in nodes_to_extract:
-                    try:
-                        node_id = node_info['node_id']
-                        prompt = node_info['prompt']
-                        
-                        logger.info(f"批量提取关键词: 节点 {node_id}")
-                        keywords = run_async(extract_keywords_force(prompt))  # 使用强制提取，绕过缓存
-                        db.update_node(node_id, keywords=keywords)
-                        extracted_count += 1
-                        logger.info(f"节点 {node_id} 关键词提取完成，共 {len(keywords)} 个关键词")
-                        
-                    except Exception as e:
-                        logger.error(f"节点 {node_id} 关键词提取失败: {e}")
-                        # 使用备用关键词
-                        backup_keywords = generate_creative_keywords(prompt)
-                        db.update_node(node_id, keywords=backup_keywords)
-                        extracted_count += 1
+                batch_size = keyword_batch_size()
+                batches = [nodes_to_extract[i:i + batch_size]
+                           for i in range(0, n_extract, batch_size)]
+                await asyncio.gather(*(extract_batch(batch) for batch in batches))
                 
-                db.update_task(task_id, 'completed', {
+                result = {
                     'extracted_count': extracted_count,
-                    'total_nodes': len(nodes_to_extract),
+                    'total_nodes': n_extract,
                     'success': True
-                })
+                }
+                db.update_task(task_id, 'completed', result)
+                publish_task_event(task_id, 'completed', result)
                 
-                logger.info(f"批量关键词提取完成: {extracted_count}/{len(nodes_to_extract)} 个节点")
+                logger.info("批量关键词提取完成: %d/%d 个节点", extracted_count, n_extract)
                 
             except Exception as e:
-                logger.error(f"批量关键词提取失败: {e}")
+                logger.error("批量关键词提取失败: %s", e)
                 db.update_task(task_id, 'failed', error=str(e))
-        
-        # 提交后台任务
-        executor.submit(batch_extract_keywords)
-        
-        return jsonify({
-            'success': True,
-            'task_id': task_id,
-            'message': f'开始为 {len(nodes_to_extract)} 个节点提取关键词',
-            'nodes_to_extract': len(nodes_to_extract),
-            'total_nodes': len(tree_data['nodes'])
-        })
+                publish_task_event(task_id, 'failed', error=str(e))
+            finally:
+                _finish_inflight_extraction(inflight_key)
+        
+        def expire_task():
+            # 在溢出缓冲中等待过久，放弃执行
+            _finish_inflight_extraction(inflight_key)
+            db.update_task(task_id, 'failed', error='排队超时，请重试')
+            publish_task_event(task_id, 'failed', error='排队超时，请重试')
+        
+        # 由调度线程在常驻事件循环中执行；队列和溢出缓冲都满时拒绝，由客户端稍后重试
+        if not extract_scheduler.submit(lambda: run_async(batch_extract_keywords()), expire_task):
+            logger.warning("后台任务队列已满，拒绝批量提取请求: %s", tree_id)
+            _finish_inflight_extraction(inflight_key)
+            db.update_task(task_id, 'failed', error='服务器繁忙')
+            return busy_response()
+        
+        return jsonify(ExtractTaskResponse(
+            True, task_id, f'开始为 {n_extract} 个节点提取关键词', n_extract, n_total
+        ))
         
     except Exception as e:
-        logger.error(f"批量提取关键词API失败: {e}")
+        logger.error("批量提取关键词API失败: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+@app.route('/api/metrics')
+def get_metrics():
+    """后台任务队列指标"""
+    return jsonify(extract_scheduler.metrics())
+
 # ==================== 数据库管理 API ====================
 
 @app.route('/api/database/stats', methods=['GET'])
@@ -2668,42 +3180,67 @@ def reset_database():
             'error': str(e)
         }), 500
 
-if __name__ == '__main__':
+def main():
+    """启动 Web 服务器（python app.py 和 start.py 共用的入口）"""
     # 创建输出目录
     Path(generation_config.output_dir).mkdir(exist_ok=True)
     
     # 启动Web服务器
     import socket
     
-    # 查找可用端口
-    def find_free_port():
+    # 绑定首个可用端口并直接交给服务器使用，避免"探测后释放再重新绑定"之间被抢占
+    LISTEN_BACKLOG = 1024
+    
+    def bind_server_socket():
         ports_to_try = [8080, 8081, 8082, 9000, 9001, 9002]
-        for port in ports_to_try:
+        for port in ports_to_try + [0]:  # 都被占用时由系统分配空闲端口
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            if os.name != 'nt':
+                # Windows 上 SO_REUSEADDR 允许抢占已被占用的端口，只在其他平台启用
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            # 关闭 Nagle 算法，避免小 JSON 响应在长连接上被延迟发送
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.bind(('127.0.0.1', port))
-                    return port
+                sock.bind(('127.0.0.1', port))
             except OSError:
+                sock.close()
                 continue
-        return 8080  # 默认端口
+            sock.listen(LISTEN_BACKLOG)
+            return sock
+    
+    # 优先使用生产级 WSGI 服务器 waitress（跨平台，多线程），未安装时回退到 Flask 开发服务器。
+    # 任务队列、事件流订阅等状态保存在进程内，因此只能单进程多线程运行。
+    try:
+        from waitress import serve
+    except ImportError:
+        serve = None
+        logger.warning("未安装 waitress，回退到 Flask 开发服务器（不适合生产环境），"
+                       "请运行 pip install -r requirements.txt")
+    
+    def run_server(sock):
+        if serve is not None:
+            # waitress 默认对连接启用 TCP_NODELAY
+            serve(app, sockets=[sock], threads=16, backlog=LISTEN_BACKLOG)
+        else:
+            from werkzeug.serving import make_server, WSGIRequestHandler
+            
+            class NoDelayRequestHandler(WSGIRequestHandler):
+                # 对每个接受的连接设置 TCP_NODELAY
+                disable_nagle_algorithm = True
+            
+            host, port = sock.getsockname()
+            make_server(host, port, app, threaded=True, request_handler=NoDelayRequestHandler,
+                        fd=sock.fileno()).serve_forever()
     
-    port = find_free_port()
+    sock = bind_server_socket()
+    port = sock.getsockname()[1]
     print("🚀 启动Web服务器...")
     print(f"📱 请在浏览器中访问: http://localhost:{port}")
     
     try:
-        app.run(host='localhost', port=port, debug=False, threaded=True)
+        run_server(sock)
     except OSError as e:
         print(f"❌ 端口 {port} 启动失败: {e}")
-        print("💡 尝试使用其他端口...")
-        # 尝试其他端口
-        for backup_port in [8888, 7777, 6666]:
-            try:
-                print(f"🔄 尝试端口 {backup_port}...")
-                app.run(host='localhost', port=backup_port, debug=False, threaded=True)
-                break
-            except OSError:
-                continue
-        else:
-            print("❌ 所有端口都被占用，请手动指定端口")
-            print("💡 或者重启计算机后再试")
\ No newline at end of file
+
+if __name__ == '__main__':
+    main()
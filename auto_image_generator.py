@@ -28,7 +28,6 @@ if sys.platform.startswith('win'):
         pass
 
 import asyncio
-import aiohttp
 import json
 import base64
 import time
@@ -42,7 +41,7 @@ import logging
 import hashlib
 
 # 导入新的AI客户端系统
-from ai_client import AIClientFactory, AIProviderConfig, AIProviderType
+from ai_client import AIClientFactory, AIProviderConfig, AIProviderType, get_http_session, close_http_session
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -160,10 +159,10 @@ class OllamaClient:
 }"""
 
         # 使用 Ollama 的视觉 API 格式
-        async with aiohttp.ClientSession() as session:
-            payload = {
-                "model": self.model,
-                "prompt": f"""请评估这张图像的质量。
+        session = get_http_session()
+        payload = {
+            "model": self.model,
+            "prompt": f"""请评估这张图像的质量。
 
 **原始提示词**: {original_prompt}
 
@@ -174,63 +173,63 @@ class OllamaClient:
 4. 整体风格和氛围是否符合原始描述？
 
 请按照系统提示的格式返回JSON评估结果。""",
-                "system": system_prompt,
-                "images": [image_base64],  # Ollama 视觉 API 格式
-                "stream": False
-            }
-            
-            try:
-                async with session.post(f"{self.base_url}/api/generate", json=payload) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        response_text = result.get("response", "")
-                        
-                        # 尝试解析JSON响应
-                        try:
-                            # 提取JSON部分
-                            json_start = response_text.find('{')
-                            json_end = response_text.rfind('}') + 1
-                            if json_start >= 0 and json_end > json_start:
-                                json_str = response_text[json_start:json_end]
-                                
-                                # 清理JSON字符串，移除控制字符
-                                json_str = self._clean_json_string(json_str)
-                                logger.debug(f"提取并清理的JSON字符串: {json_str[:200]}...")
-                                evaluation = json.loads(json_str)
-                                
-                                # 确保评分在合理范围内
-                                raw_score = evaluation.get("score", 0)
-                                final_score = float(raw_score)
-                                if final_score > 10:
-                                    final_score = final_score / 10  # 如果是百分制，转换为10分制
-                                final_score = max(0, min(10, final_score))  # 限制在0-10范围
-                                
-                                logger.info(f"JSON解析成功 - 原始评分: {raw_score}, 最终评分: {final_score}")
-                                
-                                return ImageQuality(
-                                    score=final_score,
-                                    feedback=evaluation.get("feedback", ""),
-                                    suggestions=evaluation.get("suggestions", []),
-                                    defects_found=evaluation.get("defects_found", []),
-                                    consistency_issues=evaluation.get("consistency_issues", []),
-                                    original_prompt_accuracy=float(evaluation.get("original_prompt_accuracy", final_score))
-                                )
-                        except (json.JSONDecodeError, ValueError) as e:
-                            logger.warning(f"JSON解析失败: {e}")
-                            logger.debug(f"原始响应文本: {response_text[:500]}...")
-                        
-                        # 如果无法解析JSON，使用文本分析
-                        return self._parse_text_evaluation(response_text)
-                    else:
-                        raise Exception(f"Ollama 视觉API错误: {response.status}")
-            except Exception as e:
-                logger.error(f"图像评估失败: {e}")
-                # 返回默认评估
-                return ImageQuality(
-                    score=6.0,
-                    feedback="无法进行图像评估，使用默认评分",
-                    suggestions=["检查网络连接", "确认模型支持视觉功能"]
-                )
+            "system": system_prompt,
+            "images": [image_base64],  # Ollama 视觉 API 格式
+            "stream": False
+        }
+        
+        try:
+            async with session.post(f"{self.base_url}/api/generate", json=payload) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    response_text = result.get("response", "")
+                    
+                    # 尝试解析JSON响应
+                    try:
+                        # 提取JSON部分
+                        json_start = response_text.find('{')
+                        json_end = response_text.rfind('}') + 1
+                        if json_start >= 0 and json_end > json_start:
+                            json_str = response_text[json_start:json_end]
+                            
+                            # 清理JSON字符串，移除控制字符
+                            json_str = self._clean_json_string(json_str)
+                            logger.debug(f"提取并清理的JSON字符串: {json_str[:200]}...")
+                            evaluation = json.loads(json_str)
+                            
+                            # 确保评分在合理范围内
+                            raw_score = evaluation.get("score", 0)
+                            final_score = float(raw_score)
+                            if final_score > 10:
+                                final_score = final_score / 10  # 如果是百分制，转换为10分制
+                            final_score = max(0, min(10, final_score))  # 限制在0-10范围
+                            
+                            logger.info(f"JSON解析成功 - 原始评分: {raw_score}, 最终评分: {final_score}")
+                            
+                            return ImageQuality(
+                                score=final_score,
+                                feedback=evaluation.get("feedback", ""),
+                                suggestions=evaluation.get("suggestions", []),
+                                defects_found=evaluation.get("defects_found", []),
+                                consistency_issues=evaluation.get("consistency_issues", []),
+                                original_prompt_accuracy=float(evaluation.get("original_prompt_accuracy", final_score))
+                            )
+                    except (json.JSONDecodeError, ValueError) as e:
+                        logger.warning(f"JSON解析失败: {e}")
+                        logger.debug(f"原始响应文本: {response_text[:500]}...")
+                    
+                    # 如果无法解析JSON，使用文本分析
+                    return self._parse_text_evaluation(response_text)
+                else:
+                    raise Exception(f"Ollama 视觉API错误: {response.status}")
+        except Exception as e:
+            logger.error(f"图像评估失败: {e}")
+            # 返回默认评估
+            return ImageQuality(
+                score=6.0,
+                feedback="无法进行图像评估，使用默认评分",
+                suggestions=["检查网络连接", "确认模型支持视觉功能"]
+            )
     
     def _clean_json_string(self, json_str: str) -> str:
         """清理JSON字符串，移除控制字符和格式问题"""
@@ -461,28 +460,28 @@ class ComfyUIClient:
     
     async def submit_workflow(self, workflow: Dict) -> str:
         """提交工作流"""
-        async with aiohttp.ClientSession() as session:
-            payload = {
-                "prompt": workflow,
-                "client_id": f"client_{int(time.time())}_{random.randint(1000, 9999)}"
-            }
-            
-            async with session.post(f"{self.base_url}/prompt", json=payload) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    return result["prompt_id"]
-                else:
-                    raise Exception(f"ComfyUI API error: {response.status}")
+        session = get_http_session()
+        payload = {
+            "prompt": workflow,
+            "client_id": f"client_{int(time.time())}_{random.randint(1000, 9999)}"
+        }
+        
+        async with session.post(f"{self.base_url}/prompt", json=payload) as response:
+            if response.status == 200:
+                result = await response.json()
+                return result["prompt_id"]
+            else:
+                raise Exception(f"ComfyUI API error: {response.status}")
     
     async def get_workflow_status(self, prompt_id: str) -> Dict:
         """获取工作流状态"""
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{self.base_url}/history/{prompt_id}") as response:
-                if response.status == 200:
-                    result = await response.json()
-                    return result.get(prompt_id, {})
-                else:
-                    return {}
+        session = get_http_session()
+        async with session.get(f"{self.base_url}/history/{prompt_id}") as response:
+            if response.status == 200:
+                result = await response.json()
+                return result.get(prompt_id, {})
+            else:
+                return {}
     
     async def wait_for_completion(self, prompt_id: str, max_wait: int = 300) -> bool:
         """等待工作流完成"""
@@ -522,18 +521,18 @@ class ComfyUIClient:
             raise Exception("No image found in outputs")
         
         # 下载图像
-        async with aiohttp.ClientSession() as session:
-            params = {
-                "filename": image_info["filename"],
-                "subfolder": image_info["subfolder"],
-                "type": image_info["type"]
-            }
-            
-            async with session.get(f"{self.base_url}/view", params=params) as response:
-                if response.status == 200:
-                    return await response.read()
-                else:
-                    raise Exception(f"Failed to download image: {response.status}")
+        session = get_http_session()
+        params = {
+            "filename": image_info["filename"],
+            "subfolder": image_info["subfolder"],
+            "type": image_info["type"]
+        }
+        
+        async with session.get(f"{self.base_url}/view", params=params) as response:
+            if response.status == 200:
+                return await response.read()
+            else:
+                raise Exception(f"Failed to download image: {response.status}")
 
 class AutoImageGenerator:
     """自动化图像生成器"""
@@ -783,6 +782,8 @@ async def main():
         print(f"质量评分: {score}/10")
         print(f"状态: {status}")
         print("-" * 50)
+    
+    await close_http_session()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
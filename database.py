@@ -30,41 +30,497 @@ if sys.platform.startswith('win'):
 import sqlite3
 import json
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Iterator, Tuple
 import logging
+import itertools
+import base64
+import hashlib
+import threading
+import queue
+import atexit
+import shutil
+import time
+import zlib
+import copy
+from contextlib import contextmanager
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+# JSON 字段编解码：安装了 orjson 时使用 orjson，仍以文本形式存储，与已有数据和 JSON1 函数兼容
+if orjson is not None:
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    _loads = orjson.loads
+else:
+    _dumps = json.dumps
+    _loads = json.loads
+
+# 较大的 JSON 字段（节点关键词、任务结果、关键词缓存）用 zlib 压缩后以 BLOB 存储；
+# 小值压缩收益有限，仍保存为文本。读取时按类型区分，兼容已有的文本数据
+COMPRESS_MIN_SIZE = 512
+
+def _pack_json(obj) -> Any:
+    """序列化 JSON 字段，超过 COMPRESS_MIN_SIZE 字节时压缩为 BLOB"""
+    text = _dumps(obj)
+    if len(text) < COMPRESS_MIN_SIZE:
+        return text
+    return sqlite3.Binary(zlib.compress(text.encode('utf-8'), 6))
+
+def _unpack_json(value):
+    """解析 _pack_json 写入的字段（文本或压缩后的 BLOB）"""
+    if isinstance(value, bytes):
+        value = zlib.decompress(value)
+    return _loads(value)
+
+# update_node 允许更新的节点字段，其中以 JSON 存储的字段，以及可压缩存储的字段
+# （branch_info 需要在 SQL 中用 json_extract 读取，保持文本）
+NODE_UPDATE_COLUMNS = frozenset({
+    'image_path', 'status', 'quality_score', 'accuracy_score', 'prompt', 'keywords', 'branch_info'
+})
+NODE_JSON_COLUMNS = frozenset({'keywords', 'branch_info'})
+NODE_PACKED_COLUMNS = frozenset({'keywords'})
+
+# get_node / iter_tree_nodes 返回的节点字段
+NODE_COLUMNS = (
+    'node_id', 'tree_id', 'parent_id', 'prompt', 'image_path', 'has_image',
+    'keywords', 'quality_score', 'accuracy_score', 'status', 'branch_info'
+)
+TREE_NODE_COLUMNS = (
+    'node_id', 'prompt', 'parent_id', 'image_path', 'has_image',
+    'keywords', 'quality_score', 'accuracy_score', 'status', 'branch_info', 'created_at'
+)
+# iter_tree_nodes 每次借用读连接取出的节点行数
+TREE_NODES_PAGE_SIZE = 256
+
+# 关键词缓存表（位于附加的内存库 kc 中）
+KEYWORD_CACHE_DDL = '''
+    CREATE TABLE IF NOT EXISTS kc.keyword_cache (
+        prompt_hash BLOB PRIMARY KEY,
+        prompt TEXT NOT NULL,
+        keywords TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        usage_count INTEGER DEFAULT 1
+    )
+'''
+
+# 添加子节点：层级 = 父节点层级 + 1，分支序号 = 已有同级节点数
+ADD_CHILD_NODE_SQL = '''
+    INSERT INTO nodes (node_id, tree_id, parent_id, prompt, branch_info, status)
+    SELECT ?, ?, p.node_id, ?, json_object(
+        'level', p.level + 1,
+        'branch_index', p.siblings,
+        'branch_direction', COALESCE(?, '分支' || (p.siblings + 1)),
+        'version', 'v' || (p.level + 1) || '.' || (p.siblings + 1)
+    ), ?
+    FROM (
+        SELECT node_id,
+               COALESCE(json_extract(branch_info, '$.level'), 0) AS level,
+               (SELECT COUNT(*) FROM nodes WHERE parent_id = ?) AS siblings
+        FROM nodes WHERE node_id = ?
+    ) p
+'''
+
+# 高频语句：定义为模块常量，各处共用同一 SQL 文本，命中连接的预编译语句缓存
+GET_NODE_SQL = '''
+    SELECT node_id, tree_id, parent_id, prompt, image_path,
+           EXISTS(SELECT 1 FROM node_images i WHERE i.node_id = n.node_id) AS has_image,
+           keywords, quality_score, accuracy_score, status, branch_info
+    FROM nodes n WHERE node_id = ?
+'''
+GET_NODE_IMAGE_SQL = 'SELECT image_data FROM node_images WHERE node_id = ?'
+SET_NODE_IMAGE_SQL = '''
+    INSERT INTO node_images (node_id, image_data) VALUES (?, ?)
+    ON CONFLICT(node_id) DO UPDATE SET image_data = excluded.image_data
+'''
+DELETE_NODE_IMAGE_SQL = 'DELETE FROM node_images WHERE node_id = ?'
+COMPLETE_TASK_SQL = '''
+    UPDATE generation_tasks
+    SET status = 'completed', result = ?, completed_at = CURRENT_TIMESTAMP
+    WHERE task_id = ?
+'''
+# 未完成的任务也可以记录中间结果（如进度），不传时保留原值
+UPDATE_TASK_SQL = '''
+    UPDATE generation_tasks
+    SET status = ?, result = COALESCE(?, result), error_message = ?
+    WHERE task_id = ?
+'''
+GET_TASK_SQL = '''
+    SELECT task_id, tree_id, node_id, task_type, status, result, error_message
+    FROM generation_tasks WHERE task_id = ?
+'''
+# 插入新记录，已存在时只增加使用次数
+CACHE_KEYWORDS_SQL = '''
+    INSERT INTO kc.keyword_cache (prompt_hash, prompt, keywords)
+    VALUES (?, ?, ?)
+    ON CONFLICT(prompt_hash) DO UPDATE SET usage_count = usage_count + 1
+'''
+GET_CACHED_KEYWORDS_SQL = 'SELECT keywords FROM kc.keyword_cache WHERE prompt_hash = ?'
+
+# 清理任务每批删除的行数，每批单独提交，避免长时间持有写锁
+CLEANUP_BATCH_SIZE = 5000
+
+# 增量回收后仍超过该空闲页数（数据库未启用增量模式）时才执行完整 VACUUM
+VACUUM_FREELIST_THRESHOLD = 1000
+
+# 每个连接缓存的预编译语句数（默认 128）
+CACHED_STATEMENTS = 256
+
+def _cutoff_timestamp(days: int) -> str:
+    """N 天前的 UTC 时间，格式与 CURRENT_TIMESTAMP 一致，可直接与时间列比较（能使用索引）"""
+    return (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+def _node_image_statement(node_id: str, image_data: Optional[bytes]) -> Tuple[str, tuple]:
+    """写入或清除节点图像数据的语句"""
+    if image_data is None:
+        return DELETE_NODE_IMAGE_SQL, (node_id,)
+    return SET_NODE_IMAGE_SQL, (node_id, sqlite3.Binary(image_data))
+
+def _prompt_key(prompt: str) -> bytes:
+    """关键词缓存键：提示词的 16 字节 BLAKE2b 摘要，以 BLOB 形式存储"""
+    return sqlite3.Binary(hashlib.blake2b(prompt.encode('utf-8'), digest_size=16).digest())
+
+# 定期运行 PRAGMA optimize 的间隔（秒）
+OPTIMIZE_INTERVAL = 3600
+
+def _run_optimize(conn: sqlite3.Connection):
+    # analysis_limit 限制每个索引的采样行数，保证 optimize 开销可控
+    conn.execute("PRAGMA analysis_limit = 400")
+    conn.execute("PRAGMA optimize")
+
+# 两次查询 PRAGMA data_version 之间的最短间隔（秒）：其他进程的提交最多延迟这么久被察觉
+DATA_VERSION_POLL_INTERVAL = 0.5
+
+# 写线程每批最多合并的写操作数，以及收到第一条后等待更多写操作的时间（秒）；
+# 批次中有等待提交结果的写操作时不再等待，立即提交
+WRITE_BATCH_SIZE = 100
+WRITE_COALESCE_WINDOW = 0.01
+
+class QueuedWrite:
+    """排队等待写线程提交的一组语句"""
+    
+    __slots__ = ('statements', 'bump_version', 'done', 'error')
+    
+    def __init__(self, statements: List[Tuple[str, Any]], bump_version: bool, wait: bool):
+        self.statements = statements
+        self.bump_version = bump_version
+        self.done = threading.Event() if wait else None
+        self.error = None
+
+class LRUCache:
+    """线程安全的简单 LRU 缓存"""
+    
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+    
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+class SQLiteConnectionPool:
+    """SQLite 连接池：多个读连接轮流复用，写操作共用一个加锁的写连接
+
+    连接创建时配置一次，之后不再关闭；WAL 模式下读连接不会被写操作阻塞。
+    """
+    
+    def __init__(self, db_path: str, reader_count: int, configure):
+        self._db_path = db_path
+        self._configure = configure
+        self._writer = self._create()
+        # 写连接可重入：写方法内部可能调用其他写方法
+        self._writer_lock = threading.RLock()
+        self._readers = queue.Queue()
+        self._closed = False
+        for _ in range(reader_count):
+            self._readers.put(self._create())
+        # 专用于读取 PRAGMA data_version 的连接：其他连接（包括其他进程）提交后该值会变化，
+        # 本连接从不写入，因此本进程写连接的提交同样能被察觉
+        self._version_lock = threading.Lock()
+        self._version_conn = self._create_version_conn()
+        self._version = None
+        self._version_checked_at = float('-inf')
+    
+    def _create_version_conn(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._db_path, check_same_thread=False, uri=True, isolation_level=None)
+    
+    def data_version(self) -> int:
+        """数据库文件的 PRAGMA data_version
+
+        最多每 DATA_VERSION_POLL_INTERVAL 秒查询一次，其余调用直接返回上次的结果，
+        不在每次缓存命中时都经过加锁的 SQL 查询。
+        """
+        if time.monotonic() - self._version_checked_at < DATA_VERSION_POLL_INTERVAL:
+            return self._version
+        with self._version_lock:
+            # 等锁期间可能已有其他线程刚查询过
+            if time.monotonic() - self._version_checked_at >= DATA_VERSION_POLL_INTERVAL:
+                self._version = self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+                self._version_checked_at = time.monotonic()
+            return self._version
+    
+    def _create(self) -> sqlite3.Connection:
+        # uri=True 以便 ATTACH 共享内存库；普通文件路径不受影响
+        # isolation_level=None：不再隐式 BEGIN，事务由 TreeDatabase._conn 显式开启和提交
+        conn = sqlite3.connect(self._db_path, check_same_thread=False, uri=True,
+                               cached_statements=CACHED_STATEMENTS, isolation_level=None)
+        self._configure(conn)
+        return conn
+    
+    @contextmanager
+    def reader(self):
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+    
+    @contextmanager
+    def writer(self):
+        with self._writer_lock:
+            yield self._writer
+    
+    def optimize(self):
+        """在写连接上运行 PRAGMA optimize，只对统计信息过期的索引做有限的 ANALYZE"""
+        with self._writer_lock:
+            _run_optimize(self._writer)
+    
+    @property
+    def closed(self) -> bool:
+        return self._closed
+    
+    def close_all(self):
+        """关闭所有连接，关闭前各自运行一次 PRAGMA optimize"""
+        with self._writer_lock:
+            if self._closed:
+                return
+            self._closed = True
+            connections = [self._writer]
+            while True:
+                try:
+                    connections.append(self._readers.get_nowait())
+                except queue.Empty:
+                    break
+            for conn in connections:
+                try:
+                    _run_optimize(conn)
+                    conn.close()
+                except sqlite3.Error as e:
+                    logger.warning(f"关闭数据库连接失败: {e}")
+            with self._version_lock:
+                self._version_conn.close()
+
 class TreeDatabase:
     """树状图像生成数据库"""
     
+    # 建表/数据库级 PRAGMA 每个数据库文件只需执行一次
+    _bootstrap_lock = threading.Lock()
+    _initialized = set()
+    
     def __init__(self, db_path: str = "tree_generator.db"):
         self.db_path = db_path
-        self.init_database()
+        # 本进程树/节点写入的计数，与数据库文件的 data_version 一起组成 data_version 属性
+        self._version_counter = itertools.count(1)
+        self._local_version = 0
+        # 节点缓存按数据版本号校验，本进程写入后旧条目立即失效，其他进程写入后最多延迟
+        # DATA_VERSION_POLL_INTERVAL 秒失效；关键词缓存只在删除记录时清空
+        self._node_cache = LRUCache(1024)
+        self._keyword_cache = LRUCache(1024)
+        # update_node 按更新字段组合缓存的 SQL 文本
+        self._update_sql_cache: Dict[Tuple[str, ...], str] = {}
+        # 关键词缓存内存库（同一数据库文件在进程内共享一份）及其落盘文件
+        path_key = hashlib.blake2b(str(Path(db_path).resolve()).encode('utf-8'), digest_size=8).hexdigest()
+        self._keyword_cache_uri = f"file:aits_keyword_cache_{path_key}?mode=memory&cache=shared"
+        self._keyword_cache_path = Path(db_path).with_suffix('.keywords.db')
+        self._bootstrap_db()
+        self._pool = SQLiteConnectionPool(db_path, max(4, os.cpu_count() or 1), self._configure_conn)
+        self._load_keyword_cache()
+        
+        # 高频的小写入（节点/任务状态更新、关键词缓存）由单独的写线程合并提交
+        self._write_queue = queue.Queue()
+        # 已入队但尚未提交完成的写操作数，为 0 时 flush 直接返回
+        self._pending_writes = 0
+        self._pending_lock = threading.Lock()
+        threading.Thread(target=self._writer_loop, name='db-writer', daemon=True).start()
+        threading.Thread(target=self._optimize_loop, name='db-optimize', daemon=True).start()
+        atexit.register(self.close)
     
-    def _get_connection(self):
-        """获取配置好的数据库连接"""
-        conn = sqlite3.connect(self.db_path)
-        # 设置连接参数以确保UTF-8编码正确处理
-        conn.execute("PRAGMA encoding = 'UTF-8'")
-        conn.execute("PRAGMA journal_mode = WAL")
+    def close(self):
+        """写完排队的写操作、保存关键词缓存后关闭连接池"""
+        self.flush()
+        if not self._pool.closed:
+            self._save_keyword_cache()
+        self._pool.close_all()
+    
+    def _optimize_loop(self):
+        """定期刷新查询规划器的统计信息"""
+        while True:
+            time.sleep(OPTIMIZE_INTERVAL)
+            try:
+                self._pool.optimize()
+            except sqlite3.Error as e:
+                logger.warning(f"PRAGMA optimize 失败: {e}")
+    
+    def _bump_data_version(self):
+        """标记树/节点数据已变化"""
+        self._local_version = next(self._version_counter)
+    
+    @property
+    def data_version(self) -> Tuple[int, int]:
+        """树/节点数据版本，供缓存判断是否失效
+
+        本进程的写入立即体现在计数中；其他进程（如 db_maintenance.py）提交后
+        SQLite 的 PRAGMA data_version 会变化（最多延迟 DATA_VERSION_POLL_INTERVAL 秒察觉），
+        两者任一变化即视为数据已变。
+        """
+        return self._local_version, self._pool.data_version()
+    
+    def _configure_conn(self, conn: sqlite3.Connection):
+        """配置新建的物理连接（连接池创建连接时执行一次，借用时不再重复）"""
         conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA mmap_size = 268435456")  # 256MB
+        conn.execute("PRAGMA cache_size = -65536")  # 64MB
+        conn.execute("PRAGMA busy_timeout = 5000")
+        # WAL 达到约 1000 页（4MB）时自动检查点，避免批量删除后 WAL 无限增长
+        conn.execute("PRAGMA wal_autocheckpoint = 1000")
+        # 删除树时由外键级联删除节点、图像数据和任务
+        conn.execute("PRAGMA foreign_keys = ON")
+        # 行对象按列名访问，同时仍支持下标和解包
+        conn.row_factory = sqlite3.Row
         # 设置文本工厂以确保字符串正确处理
         conn.text_factory = str
-        return conn
+        
+        # 关键词缓存放在进程内共享的内存库中，不占用主库的 WAL 和页缓存
+        conn.execute("ATTACH DATABASE ? AS kc", (self._keyword_cache_uri,))
+        # 共享缓存使用表级锁，读连接读取未提交数据以免与写连接互相阻塞
+        conn.execute("PRAGMA read_uncommitted = 1")
+        conn.execute(KEYWORD_CACHE_DDL)
+    
+    def _load_keyword_cache(self):
+        """启动时把上次保存的关键词缓存和旧版主库中的缓存表载入内存库"""
+        if self._keyword_cache_path.exists():
+            # ATTACH/DETACH 不能在事务中执行
+            with self._conn(write=True, transaction=False) as conn:
+                try:
+                    conn.execute("ATTACH DATABASE ? AS kc_disk", (str(self._keyword_cache_path),))
+                    try:
+                        conn.execute('INSERT OR IGNORE INTO kc.keyword_cache SELECT * FROM kc_disk.keyword_cache')
+                    finally:
+                        conn.execute("DETACH DATABASE kc_disk")
+                except sqlite3.Error as e:
+                    logger.warning(f"载入关键词缓存失败: {e}")
+        
+        with self._conn(write=True) as conn:
+            if self._table_exists(conn, 'keyword_cache'):
+                conn.execute('INSERT OR IGNORE INTO kc.keyword_cache SELECT * FROM main.keyword_cache')
+                conn.execute('DROP TABLE main.keyword_cache')
+                logger.info("已把主库中的关键词缓存迁移到内存库")
+    
+    def _save_keyword_cache(self):
+        """把内存中的关键词缓存写入磁盘文件，下次启动时载入"""
+        if sqlite3.sqlite_version_info < (3, 27, 0):
+            # VACUUM INTO 需要 SQLite 3.27+，旧版本只在进程内保留缓存
+            return
+        tmp_path = self._keyword_cache_path.with_name(self._keyword_cache_path.name + '.tmp')
+        try:
+            if tmp_path.exists():
+                tmp_path.unlink()
+            with self._pool.writer() as conn:
+                conn.execute("VACUUM kc INTO ?", (str(tmp_path),))
+            os.replace(tmp_path, self._keyword_cache_path)
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"保存关键词缓存失败: {e}")
+    
+    @contextmanager
+    def _conn(self, write: bool = False, transaction: bool = True):
+        """从连接池借用连接并归还，连接不关闭
+
+        write=True 时使用唯一的写连接（加锁串行），否则使用读连接。写连接默认在
+        BEGIN IMMEDIATE 事务中使用，退出时提交（异常时回滚）；嵌套借用时加入外层事务。
+        transaction=False 用于不能在事务中执行的语句（ATTACH、VACUUM、检查点等）。
+        """
+        if not write:
+            with self._pool.reader() as conn:
+                yield conn
+            return
+        
+        with self._pool.writer() as conn:
+            if not transaction or conn.in_transaction:
+                yield conn
+                return
+            
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+            # 方法内部可能已经提前 commit
+            if conn.in_transaction:
+                conn.execute('COMMIT')
     
-    def init_database(self):
+    def _bootstrap_db(self):
+        """初始化数据库：设置数据库级 PRAGMA 并建表，同一数据库文件只执行一次"""
+        with self._bootstrap_lock:
+            if self.db_path in self._initialized:
+                return
+            conn = sqlite3.connect(self.db_path)
+            try:
+                self._init_schema(conn)
+            finally:
+                conn.close()
+            self._initialized.add(self.db_path)
+    
+    def _init_schema(self, conn: sqlite3.Connection):
         """初始化数据库表结构"""
-        # 确保SQLite使用UTF-8编码
-        with self._get_connection() as conn:
-            # 设置SQLite连接的编码和其他参数
-            conn.execute("PRAGMA encoding = 'UTF-8'")
+        # encoding/journal_mode 作用于数据库文件本身，WAL 设置会持久保存
+        conn.execute("PRAGMA encoding = 'UTF-8'")
+        # 新建数据库时生效；已有数据库在下一次完整 VACUUM 后转换
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # 内存数据库不支持 WAL
+        if self.db_path != ':memory:':
             conn.execute("PRAGMA journal_mode = WAL")
-            conn.execute("PRAGMA synchronous = NORMAL")
-            conn.execute("PRAGMA temp_store = MEMORY")
-            conn.execute("PRAGMA mmap_size = 268435456")  # 256MB
+        with conn:
+            # 整个建表/迁移过程在一个事务中完成
+            conn.execute('BEGIN')
+            
+            # 旧版表没有级联删除外键，先改名保留，建好新表后再复制数据
+            rebuild = self._needs_cascade_rebuild(conn)
+            if rebuild:
+                # 改名时不改写其他表中的外键引用，新表建好后引用自然指向新表
+                conn.execute('PRAGMA legacy_alter_table = ON')
+                for table in self.CASCADE_TABLES:
+                    if self._table_exists(conn, table):
+                        conn.execute(f'ALTER TABLE {table} RENAME TO _legacy_{table}')
+                conn.execute('PRAGMA legacy_alter_table = OFF')
             
             conn.execute('''
                 CREATE TABLE IF NOT EXISTS trees (
@@ -84,7 +540,6 @@ class TreeDatabase:
                     parent_id TEXT,
                     prompt TEXT NOT NULL,
                     image_path TEXT,
-                    image_data TEXT,
                     keywords TEXT,
                     quality_score REAL DEFAULT 0.0,
                     accuracy_score REAL DEFAULT 0.0,
@@ -92,8 +547,17 @@ class TreeDatabase:
                     branch_info TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (tree_id) REFERENCES trees (tree_id),
-                    FOREIGN KEY (parent_id) REFERENCES nodes (node_id)
+                    FOREIGN KEY (tree_id) REFERENCES trees (tree_id) ON DELETE CASCADE,
+                    FOREIGN KEY (parent_id) REFERENCES nodes (node_id) ON DELETE CASCADE
+                )
+            ''')
+            
+            # 图像数据单独存放（原始字节），读取节点元数据时不再带出大字段
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS node_images (
+                    node_id TEXT PRIMARY KEY,
+                    image_data BLOB NOT NULL,
+                    FOREIGN KEY (node_id) REFERENCES nodes (node_id) ON DELETE CASCADE
                 )
             ''')
             
@@ -108,20 +572,22 @@ class TreeDatabase:
                     error_message TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     completed_at TIMESTAMP,
-                    FOREIGN KEY (tree_id) REFERENCES trees (tree_id),
-                    FOREIGN KEY (node_id) REFERENCES nodes (node_id)
+                    FOREIGN KEY (tree_id) REFERENCES trees (tree_id) ON DELETE CASCADE,
+                    FOREIGN KEY (node_id) REFERENCES nodes (node_id) ON DELETE CASCADE
                 )
             ''')
             
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS keyword_cache (
-                    prompt_hash TEXT PRIMARY KEY,
-                    prompt TEXT NOT NULL,
-                    keywords TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    usage_count INTEGER DEFAULT 1
-                )
-            ''')
+            if rebuild:
+                self._copy_legacy_tables(conn)
+            
+            # 关键词缓存已移到内存库（见 _load_keyword_cache）；
+            # 旧版主库中的缓存表若使用 MD5 十六进制文本键则直接丢弃，否则稍后迁移
+            key_type = conn.execute(
+                "SELECT type FROM pragma_table_info('keyword_cache') WHERE name = 'prompt_hash'"
+            ).fetchone()
+            if key_type and key_type[0].upper() != 'BLOB':
+                conn.execute('DROP TABLE keyword_cache')
+                logger.info("已丢弃旧版关键词缓存表（键改为 BLAKE2b 二进制摘要）")
             
             conn.execute('''
                 CREATE TABLE IF NOT EXISTS user_settings (
@@ -132,22 +598,116 @@ class TreeDatabase:
             ''')
             
             # 创建索引优化查询性能
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_nodes_tree_id ON nodes (tree_id)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_nodes_parent_id ON nodes (parent_id)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_status ON generation_tasks (status)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_keyword_cache_hash ON keyword_cache (prompt_hash)')
+            # (tree_id, created_at) 同时覆盖按树过滤和按创建时间排序
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_nodes_tree_created ON nodes (tree_id, created_at)')
+            # 根节点没有 parent_id，部分索引只收录子节点
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_nodes_parent_nonnull ON nodes (parent_id) WHERE parent_id IS NOT NULL')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_status_completed ON generation_tasks (status, completed_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_tree_status_completed ON generation_tasks (tree_id, status, completed_at)')
+            # 最近的树列表、按时间清理旧树和统计最早/最新时间都按 created_at 查找
+            new_trees_index = not self._index_exists(conn, 'idx_trees_created')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_trees_created ON trees (created_at)')
+            # 按创建时间清理图像数据
+            new_nodes_index = not self._index_exists(conn, 'idx_nodes_created')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_nodes_created ON nodes (created_at)')
             
+            # 以下旧索引已被上面的索引或主键覆盖，删除以减少写入开销
+            conn.execute('DROP INDEX IF EXISTS idx_nodes_tree_id')
+            conn.execute('DROP INDEX IF EXISTS idx_nodes_parent_id')
+            conn.execute('DROP INDEX IF EXISTS idx_tasks_status')
+            conn.execute('DROP INDEX IF EXISTS idx_keyword_cache_hash')
+            
+            conn.commit()
+        
+        # 新建索引后收集一次统计信息，让查询规划器立即使用
+        if new_trees_index or new_nodes_index:
+            conn.execute("PRAGMA analysis_limit = 400")
+            if new_trees_index:
+                conn.execute('ANALYZE trees')
+            if new_nodes_index:
+                conn.execute('ANALYZE nodes')
             conn.commit()
     
+    # 需要级联删除外键的表（按依赖顺序）
+    CASCADE_TABLES = ('nodes', 'node_images', 'generation_tasks')
+    
+    @staticmethod
+    def _table_exists(conn: sqlite3.Connection, table: str) -> bool:
+        return conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone() is not None
+    
+    @staticmethod
+    def _index_exists(conn: sqlite3.Connection, index: str) -> bool:
+        return conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index,)
+        ).fetchone() is not None
+    
+    def _needs_cascade_rebuild(self, conn: sqlite3.Connection) -> bool:
+        """旧版 nodes 表的外键没有 ON DELETE CASCADE，需要重建"""
+        if not self._table_exists(conn, 'nodes'):
+            return False
+        on_delete = {row[6] for row in conn.execute("PRAGMA foreign_key_list(nodes)")}
+        return 'CASCADE' not in on_delete
+    
+    def _copy_legacy_tables(self, conn: sqlite3.Connection):
+        """把改名保留的旧表数据复制到新表，丢弃已没有所属树的孤立记录，然后删除旧表"""
+        for table in self.CASCADE_TABLES:
+            legacy = f'_legacy_{table}'
+            if not self._table_exists(conn, legacy):
+                continue
+            new_columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+            legacy_columns = {row[1] for row in conn.execute(f"PRAGMA table_info({legacy})")}
+            columns = ', '.join(c for c in new_columns if c in legacy_columns)
+            if table == 'node_images':
+                condition = 'node_id IN (SELECT node_id FROM nodes)'
+            else:
+                condition = 'tree_id IN (SELECT tree_id FROM trees)'
+            conn.execute(f'INSERT INTO {table} ({columns}) SELECT {columns} FROM {legacy} WHERE {condition}')
+        
+        # 更早的版本把 base64 图像直接存在 nodes.image_data 中
+        if self._table_exists(conn, '_legacy_nodes'):
+            self._migrate_inline_images(conn, '_legacy_nodes')
+        
+        for table in reversed(self.CASCADE_TABLES):
+            conn.execute(f'DROP TABLE IF EXISTS _legacy_{table}')
+        logger.info("已重建数据表以启用级联删除外键")
+    
+    def _migrate_inline_images(self, conn: sqlite3.Connection, source: str):
+        """把旧版 image_data 列中的 base64 图像迁移到 node_images 表"""
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({source})")}
+        if 'image_data' not in columns:
+            return
+        
+        migrated = 0
+        cursor = conn.execute(f'''
+            SELECT node_id, image_data FROM {source}
+            WHERE image_data IS NOT NULL AND node_id IN (SELECT node_id FROM nodes)
+        ''')
+        while True:
+            rows = cursor.fetchmany(100)
+            if not rows:
+                break
+            batch = []
+            for node_id, image_data in rows:
+                try:
+                    batch.append((node_id, sqlite3.Binary(base64.b64decode(image_data))))
+                except (ValueError, TypeError) as e:
+                    logger.warning(f"节点图像数据解码失败 {node_id}: {e}")
+            conn.executemany('INSERT OR IGNORE INTO node_images (node_id, image_data) VALUES (?, ?)', batch)
+            migrated += len(batch)
+        
+        logger.info(f"已迁移 {migrated} 个节点的图像数据到 node_images 表")
+    
     def create_tree(self, root_prompt: str, metadata: Dict = None) -> str:
         """创建新的生成树"""
         tree_id = str(uuid.uuid4())
         
-        with self._get_connection() as conn:
+        with self._conn(write=True) as conn:
             conn.execute('''
                 INSERT INTO trees (tree_id, root_prompt, metadata)
                 VALUES (?, ?, ?)
-            ''', (tree_id, root_prompt, json.dumps(metadata or {})))
+            ''', (tree_id, root_prompt, _dumps(metadata or {})))
             
             # 创建根节点
             root_id = str(uuid.uuid4())
@@ -161,9 +721,10 @@ class TreeDatabase:
             conn.execute('''
                 INSERT INTO nodes (node_id, tree_id, parent_id, prompt, branch_info)
                 VALUES (?, ?, ?, ?, ?)
-            ''', (root_id, tree_id, None, root_prompt, json.dumps(branch_info)))
+            ''', (root_id, tree_id, None, root_prompt, _dumps(branch_info)))
             
             conn.commit()
+        self._bump_data_version()
         
         return tree_id
     
@@ -172,77 +733,95 @@ class TreeDatabase:
         """添加新节点"""
         node_id = str(uuid.uuid4())
         
-        with self._get_connection() as conn:
-            # 计算分支信息
+        with self._conn(write=True) as conn:
             if parent_id:
-                parent_info = conn.execute('''
-                    SELECT branch_info FROM nodes WHERE node_id = ?
-                ''', (parent_id,)).fetchone()
-                
-                if parent_info:
-                    parent_branch = json.loads(parent_info[0] or '{}')
-                    parent_level = parent_branch.get('level', 0)
-                    
-                    # 计算同级节点数量
-                    sibling_count = conn.execute('''
-                        SELECT COUNT(*) FROM nodes WHERE parent_id = ?
-                    ''', (parent_id,)).fetchone()[0]
-                    
-                    branch_info = {
-                        'level': parent_level + 1,
-                        'branch_index': sibling_count,
-                        'branch_direction': branch_direction or f'分支{sibling_count + 1}',
-                        'version': f'v{parent_level + 1}.{sibling_count + 1}'
-                    }
-                else:
-                    branch_info = {'level': 1, 'branch_index': 0, 'branch_direction': 'branch', 'version': 'v2.1'}
+                # 分支信息由父节点层级和同级节点数量计算，在一条 INSERT … SELECT 中完成
+                inserted = conn.execute(ADD_CHILD_NODE_SQL, (
+                    node_id, tree_id, prompt, branch_direction, 'pending', parent_id, parent_id
+                )).rowcount
+                if not inserted:
+                    raise ValueError(f"父节点不存在: {parent_id}")
             else:
                 branch_info = {'level': 0, 'branch_index': 0, 'branch_direction': 'root', 'version': 'v1.0'}
-            
-            conn.execute('''
-                INSERT INTO nodes (node_id, tree_id, parent_id, prompt, branch_info)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (node_id, tree_id, parent_id, prompt, json.dumps(branch_info)))
+                conn.execute('''
+                    INSERT INTO nodes (node_id, tree_id, parent_id, prompt, branch_info)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (node_id, tree_id, None, prompt, _dumps(branch_info)))
             
             conn.commit()
+        self._bump_data_version()
         
         return node_id
     
+    def add_nodes_bulk(self, tree_id: str, parent_id: str, children: List[Tuple[str, Optional[str]]],
+                       status: str = 'pending') -> List[str]:
+        """在同一事务中批量添加子节点
+
+        children 为 (prompt, branch_direction) 列表，返回按顺序对应的节点ID。
+        """
+        node_ids = [str(uuid.uuid4()) for _ in children]
+        
+        with self._conn(write=True) as conn:
+            if not conn.execute('SELECT 1 FROM nodes WHERE node_id = ?', (parent_id,)).fetchone():
+                raise ValueError(f"父节点不存在: {parent_id}")
+            # 逐行插入时同级节点数量依次递增，分支序号与逐个 add_node 一致
+            conn.executemany(ADD_CHILD_NODE_SQL, [
+                (node_id, tree_id, prompt, branch_direction, status, parent_id, parent_id)
+                for node_id, (prompt, branch_direction) in zip(node_ids, children)
+            ])
+            conn.commit()
+        self._bump_data_version()
+        
+        return node_ids
+    
     def update_node(self, node_id: str, **kwargs):
         """更新节点信息"""
         if not kwargs:
             return
         
-        # 构建更新语句
-        set_clauses = []
-        values = []
-        
-        for key, value in kwargs.items():
-            if key in ['image_path', 'image_data', 'status', 'quality_score', 'accuracy_score', 'prompt']:
-                set_clauses.append(f"{key} = ?")
-                values.append(value)
-            elif key == 'keywords':
-                set_clauses.append("keywords = ?")
-                values.append(json.dumps(value) if value else None)
-            elif key == 'branch_info':
-                set_clauses.append("branch_info = ?")
-                values.append(json.dumps(value) if value else None)
-        
-        if set_clauses:
-            set_clauses.append("updated_at = CURRENT_TIMESTAMP")
+        # 同一组更新字段复用同一条 SQL 文本，命中 sqlite3 的预编译语句缓存
+        shape = tuple(sorted(key for key in kwargs if key in NODE_UPDATE_COLUMNS))
+        has_image_update = 'image_data' in kwargs
+        if shape or has_image_update:
+            sql = self._update_sql_cache.get(shape)
+            if sql is None:
+                set_clauses = ''.join(f"{column} = ?, " for column in shape)
+                sql = f"UPDATE nodes SET {set_clauses}updated_at = CURRENT_TIMESTAMP WHERE node_id = ?"
+                self._update_sql_cache[shape] = sql
+            
+            values = [kwargs[column] for column in shape]
+            for index, column in enumerate(shape):
+                if column in NODE_PACKED_COLUMNS:
+                    values[index] = _pack_json(values[index]) if values[index] else None
+                elif column in NODE_JSON_COLUMNS:
+                    values[index] = _dumps(values[index]) if values[index] else None
             values.append(node_id)
             
-            with self._get_connection() as conn:
-                conn.execute(f'''
-                    UPDATE nodes SET {', '.join(set_clauses)}
-                    WHERE node_id = ?
-                ''', values)
-                conn.commit()
+            statements = [(sql, values)]
+            if has_image_update:
+                # image_data 为原始图像字节，None 表示清除
+                statements.append(_node_image_statement(node_id, kwargs['image_data']))
+            # 与同一时间窗口内的其他写操作合并为一个事务，提交后才返回
+            self._enqueue_write(statements, bump_version=True, wait=True)
+    
+    def get_node_image(self, node_id: str) -> Optional[bytes]:
+        """按需读取节点的图像数据（原始字节）"""
+        with self._conn() as conn:
+            row = conn.execute(GET_NODE_IMAGE_SQL, (node_id,)).fetchone()
+            return bytes(row[0]) if row else None
     
     def get_tree(self, tree_id: str) -> Optional[Dict]:
         """获取完整的树结构"""
-        with self._get_connection() as conn:
-            # 获取树信息
+        tree = self.get_tree_info(tree_id)
+        if not tree:
+            return None
+        
+        tree['nodes'] = {node['node_id']: node for node in self.iter_tree_nodes(tree_id)}
+        return tree
+    
+    def get_tree_info(self, tree_id: str) -> Optional[Dict]:
+        """获取树的基本信息（不含节点）"""
+        with self._conn() as conn:
             tree_info = conn.execute('''
                 SELECT tree_id, root_prompt, created_at, status, metadata
                 FROM trees WHERE tree_id = ?
@@ -251,91 +830,106 @@ class TreeDatabase:
             if not tree_info:
                 return None
             
-            # 获取所有节点
-            nodes_data = conn.execute('''
-                SELECT node_id, parent_id, prompt, image_path, image_data,
-                       keywords, quality_score, accuracy_score, status,
-                       branch_info, created_at
-                FROM nodes WHERE tree_id = ?
-                ORDER BY created_at
-            ''', (tree_id,)).fetchall()
-            
-            # 构建树结构
-            nodes = {}
-            root_id = None
-            
-            for node_data in nodes_data:
-                node_id, parent_id, prompt, image_path, image_data, keywords_json, \
-                quality_score, accuracy_score, status, branch_info_json, created_at = node_data
-                
-                node = {
-                    'node_id': node_id,
-                    'prompt': prompt,
-                    'parent_id': parent_id,
-                    'children': [],
-                    'image_path': image_path,
-                    'image_data': image_data,
-                    'keywords': json.loads(keywords_json) if keywords_json else [],
-                    'quality_score': quality_score or 0.0,
-                    'accuracy_score': accuracy_score or 0.0,
-                    'status': status,
-                    'branch_info': json.loads(branch_info_json) if branch_info_json else {},
-                    'created_at': created_at
-                }
-                
-                nodes[node_id] = node
-                
-                if not parent_id:  # 根节点
-                    root_id = node_id
-            
-            # 构建父子关系
-            for node_id, node in nodes.items():
-                if node['parent_id'] and node['parent_id'] in nodes:
-                    nodes[node['parent_id']]['children'].append(node_id)
+            root = conn.execute('''
+                SELECT node_id FROM nodes
+                WHERE tree_id = ? AND parent_id IS NULL
+                ORDER BY created_at LIMIT 1
+            ''', (tree_id,)).fetchone()
             
             return {
                 'tree_id': tree_id,
-                'root_id': root_id,
-                'nodes': nodes,
+                'root_id': root[0] if root else None,
                 'created_at': tree_info[2],
                 'status': tree_info[3],
-                'metadata': json.loads(tree_info[4] or '{}')
+                'metadata': _loads(tree_info[4] or '{}')
+            }
+    
+    def iter_tree_nodes(self, tree_id: str) -> Iterator[Dict]:
+        """按创建顺序逐个产出树的节点，不加载节点的图像数据
+
+        每次借用读连接只取一页（TREE_NODES_PAGE_SIZE 行），取完即归还：调用方按客户端的
+        速度流式输出，既不在整个响应期间占用连接池中的读连接，也不一次性持有所有行。
+        """
+        with self._conn() as conn:
+            # 先由 SQLite 按父节点分组拼接子节点ID，节点产出时子节点列表即已完整
+            # （子查询先按创建顺序排序，保证拼接顺序与节点创建顺序一致）
+            children = {
+                parent_id: child_ids.split(',')
+                for parent_id, child_ids in conn.execute('''
+                    SELECT parent_id, group_concat(node_id) FROM (
+                        SELECT parent_id, node_id FROM nodes
+                        WHERE tree_id = ? AND parent_id IS NOT NULL
+                        ORDER BY created_at
+                    ) GROUP BY parent_id
+                ''', (tree_id,))
             }
+        
+        # 按 (created_at, rowid) 分页，正好是 idx_nodes_tree_created 的顺序，每页从上一页末尾继续
+        after = ''
+        params = (tree_id,)
+        while True:
+            with self._conn() as conn:
+                rows = conn.execute(f'''
+                    SELECT rowid, node_id, prompt, parent_id, image_path,
+                           EXISTS(SELECT 1 FROM node_images i WHERE i.node_id = n.node_id) AS has_image,
+                           keywords, quality_score, accuracy_score, status,
+                           branch_info, created_at
+                    FROM nodes n WHERE tree_id = ? {after}
+                    ORDER BY created_at, rowid
+                    LIMIT {TREE_NODES_PAGE_SIZE}
+                ''', params).fetchall()
+            
+            # 逐行转换为节点字典后产出，JSON 字段只在产出时解析
+            for row in rows:
+                node = {column: row[column] for column in TREE_NODE_COLUMNS}
+                node['children'] = children.get(node['node_id'], [])
+                yield self._decode_node(node)
+            
+            if len(rows) < TREE_NODES_PAGE_SIZE:
+                return
+            after = 'AND (created_at, rowid) > (?, ?)'
+            params = (tree_id, rows[-1]['created_at'], rows[-1]['rowid'])
     
     def get_node(self, node_id: str) -> Optional[Dict]:
-        """获取单个节点信息"""
-        with self._get_connection() as conn:
-            node_data = conn.execute('''
-                SELECT node_id, tree_id, parent_id, prompt, image_path, image_data,
-                       keywords, quality_score, accuracy_score, status, branch_info
-                FROM nodes WHERE node_id = ?
-            ''', (node_id,)).fetchone()
-            
-            if not node_data:
-                return None
+        """获取单个节点信息（优先读取进程内缓存）"""
+        # 先记下版本号再查询，查询期间发生的写入会使本次结果在下次读取时失效
+        version = self.data_version
+        cached = self._node_cache.get(node_id)
+        # 返回深拷贝：keywords / branch_info 是可变对象，调用方修改时不能影响缓存中的节点
+        if cached is not None and cached[0] == version:
+            return copy.deepcopy(cached[1])
+        
+        node = self._load_node(node_id)
+        if node is not None:
+            self._node_cache.put(node_id, (version, node))
+            return copy.deepcopy(node)
+        return None
+    
+    def _load_node(self, node_id: str) -> Optional[Dict]:
+        """从数据库读取单个节点"""
+        with self._conn() as conn:
+            row = conn.execute(GET_NODE_SQL, (node_id,)).fetchone()
             
-            node_id, tree_id, parent_id, prompt, image_path, image_data, \
-            keywords_json, quality_score, accuracy_score, status, branch_info_json = node_data
+            if not row:
+                return None
             
-            return {
-                'node_id': node_id,
-                'tree_id': tree_id,
-                'parent_id': parent_id,
-                'prompt': prompt,
-                'image_path': image_path,
-                'image_data': image_data,
-                'keywords': json.loads(keywords_json) if keywords_json else [],
-                'quality_score': quality_score or 0.0,
-                'accuracy_score': accuracy_score or 0.0,
-                'status': status,
-                'branch_info': json.loads(branch_info_json) if branch_info_json else {}
-            }
+            return self._decode_node({column: row[column] for column in NODE_COLUMNS})
+    
+    @staticmethod
+    def _decode_node(node: Dict) -> Dict:
+        """把数据库原始字段转换为节点字典：解析 JSON 字段、补齐默认值"""
+        node['has_image'] = bool(node['has_image'])
+        node['keywords'] = _unpack_json(node['keywords']) if node['keywords'] else []
+        node['quality_score'] = node['quality_score'] or 0.0
+        node['accuracy_score'] = node['accuracy_score'] or 0.0
+        node['branch_info'] = _loads(node['branch_info']) if node['branch_info'] else {}
+        return node
     
     def create_task(self, tree_id: str, task_type: str, node_id: str = None) -> str:
         """创建生成任务"""
         task_id = str(uuid.uuid4())
         
-        with self._get_connection() as conn:
+        with self._conn(write=True) as conn:
             conn.execute('''
                 INSERT INTO generation_tasks (task_id, tree_id, node_id, task_type)
                 VALUES (?, ?, ?, ?)
@@ -343,31 +937,124 @@ class TreeDatabase:
             conn.commit()
         
         return task_id
-    
-    def update_task(self, task_id: str, status: str, result: Any = None, error: str = None):
-        """更新任务状态"""
-        with self._get_connection() as conn:
-            if status == 'completed':
-                conn.execute('''
-                    UPDATE generation_tasks 
-                    SET status = ?, result = ?, completed_at = CURRENT_TIMESTAMP
-                    WHERE task_id = ?
-                ''', (status, json.dumps(result) if result else None, task_id))
-            else:
-                conn.execute('''
-                    UPDATE generation_tasks 
-                    SET status = ?, error_message = ?
-                    WHERE task_id = ?
-                ''', (status, error, task_id))
+
+    def create_tasks_bulk(self, tree_id: str, task_type: str, node_ids: List[str],
+                          complete_task_id: str = None, complete_result: Any = None) -> List[str]:
+        """批量创建生成任务（单个事务），可同时将上游任务标记为完成"""
+        task_ids = [str(uuid.uuid4()) for _ in node_ids]
+
+        # 排队中的旧状态不能覆盖这里写入的完成状态
+        self.flush()
+        with self._conn(write=True) as conn:
+            if complete_task_id:
+                result_json = _pack_json(complete_result) if complete_result else None
+                conn.execute(COMPLETE_TASK_SQL, (result_json, complete_task_id))
+
+            conn.executemany('''
+                INSERT INTO generation_tasks (task_id, tree_id, node_id, task_type)
+                VALUES (?, ?, ?, ?)
+            ''', [(task_id, tree_id, node_id, task_type) for task_id, node_id in zip(task_ids, node_ids)])
             conn.commit()
+
+        return task_ids
+
+    def update_task(self, task_id: str, status: str, result: Any = None, error: str = None):
+        """更新任务状态（入队，由写线程异步提交）"""
+        result_json = _pack_json(result) if result else None
+        if status == 'completed':
+            statement = (COMPLETE_TASK_SQL, (result_json, task_id))
+        else:
+            statement = (UPDATE_TASK_SQL, (status, result_json, error, task_id))
+        self._enqueue_write([statement])
+    
+    def _enqueue_write(self, statements: List[Tuple[str, Any]], bump_version: bool = False,
+                       wait: bool = False):
+        """把写操作交给写线程；wait=True 时等待提交完成，失败则抛出原异常"""
+        item = QueuedWrite(statements, bump_version, wait)
+        with self._pending_lock:
+            self._pending_writes += 1
+        self._write_queue.put(item)
+        if wait:
+            item.done.wait()
+            if item.error is not None:
+                raise item.error
+    
+    def flush(self):
+        """等待调用前已入队的写操作全部提交（读己之写的同步点）
+
+        没有未完成的写操作时直接返回；否则入队一个空的哨兵并等待它完成：
+        队列先进先出，哨兵之前的写操作都已提交；不等待之后其他线程新入队的写操作。
+        """
+        if not self._pending_writes:
+            return
+        self._enqueue_write([], wait=True)
+    
+    def _writer_loop(self):
+        """写线程：合并短时间内到达的写操作（最多 WRITE_BATCH_SIZE 条），在一个事务中提交"""
+        while True:
+            item = self._write_queue.get()
+            batch = [item]
+            # 只有不等待结果的写操作才值得多等一会儿凑批；有调用方在等时只取已排队的
+            linger = item.done is None
+            deadline = time.monotonic() + WRITE_COALESCE_WINDOW
+            while len(batch) < WRITE_BATCH_SIZE:
+                timeout = deadline - time.monotonic() if linger else 0
+                try:
+                    if timeout > 0:
+                        item = self._write_queue.get(timeout=timeout)
+                    else:
+                        item = self._write_queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+                if item.done is not None:
+                    linger = False
+            
+            try:
+                self._apply_writes(batch)
+            finally:
+                with self._pending_lock:
+                    self._pending_writes -= len(batch)
+                for item in batch:
+                    if item.done is not None:
+                        item.done.set()
+    
+    def _apply_writes(self, batch: List[QueuedWrite]):
+        """提交一批写操作；整批失败时逐条重试，只让出错的那条失败"""
+        try:
+            self._commit_writes(batch)
+            return
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].error = e
+                logger.error(f"写入数据库失败: {e}")
+                return
+            logger.warning(f"批量写入失败（{len(batch)} 条），改为逐条提交: {e}")
+        
+        for item in batch:
+            try:
+                self._commit_writes([item])
+            except Exception as e:
+                item.error = e
+                logger.error(f"写入数据库失败: {e}")
+    
+    def _commit_writes(self, batch: List[QueuedWrite]):
+        if not any(item.statements for item in batch):
+            # 只有 flush 的哨兵，无需开启事务
+            return
+        with self._conn(write=True) as conn:
+            for item in batch:
+                for sql, params in item.statements:
+                    conn.execute(sql, params)
+        if any(item.bump_version for item in batch):
+            self._bump_data_version()
     
     def get_task(self, task_id: str) -> Optional[Dict]:
         """获取任务信息"""
-        with self._get_connection() as conn:
-            task_data = conn.execute('''
-                SELECT task_id, tree_id, node_id, task_type, status, result, error_message
-                FROM generation_tasks WHERE task_id = ?
-            ''', (task_id,)).fetchone()
+        # 先等待排队中的状态更新落盘，保证读到最新状态
+        self.flush()
+        with self._conn() as conn:
+            task_data = conn.execute(GET_TASK_SQL, (task_id,)).fetchone()
             
             if not task_data:
                 return None
@@ -378,53 +1065,36 @@ class TreeDatabase:
                 'node_id': task_data[2],
                 'task_type': task_data[3],
                 'status': task_data[4],
-                'result': json.loads(task_data[5]) if task_data[5] else None,
+                'result': _unpack_json(task_data[5]) if task_data[5] else None,
                 'error': task_data[6]
             }
     
     def cache_keywords(self, prompt: str, keywords: List[Dict]):
         """缓存关键词提取结果"""
-        import hashlib
-        prompt_hash = hashlib.md5(prompt.encode('utf-8')).hexdigest()
+        prompt_hash = _prompt_key(prompt)
         
-        with self._get_connection() as conn:
-            # 检查是否已存在
-            existing = conn.execute('''
-                SELECT usage_count FROM keyword_cache WHERE prompt_hash = ?
-            ''', (prompt_hash,)).fetchone()
-            
-            if existing:
-                # 更新使用次数
-                conn.execute('''
-                    UPDATE keyword_cache SET usage_count = usage_count + 1
-                    WHERE prompt_hash = ?
-                ''', (prompt_hash,))
-            else:
-                # 插入新记录
-                conn.execute('''
-                    INSERT INTO keyword_cache (prompt_hash, prompt, keywords)
-                    VALUES (?, ?, ?)
-                ''', (prompt_hash, prompt, json.dumps(keywords)))
-            
-            conn.commit()
+        # 缓存写入不必等待提交
+        self._enqueue_write([(CACHE_KEYWORDS_SQL, (prompt_hash, prompt, _pack_json(keywords)))])
     
     def get_cached_keywords(self, prompt: str) -> Optional[List[Dict]]:
         """获取缓存的关键词"""
-        import hashlib
-        prompt_hash = hashlib.md5(prompt.encode('utf-8')).hexdigest()
+        prompt_hash = _prompt_key(prompt)
+        cached = self._keyword_cache.get(prompt_hash)
+        if cached is not None:
+            return list(cached)
         
-        with self._get_connection() as conn:
-            result = conn.execute('''
-                SELECT keywords FROM keyword_cache WHERE prompt_hash = ?
-            ''', (prompt_hash,)).fetchone()
+        with self._conn() as conn:
+            result = conn.execute(GET_CACHED_KEYWORDS_SQL, (prompt_hash,)).fetchone()
             
             if result:
-                return json.loads(result[0])
+                keywords = _unpack_json(result[0])
+                self._keyword_cache.put(prompt_hash, keywords)
+                return list(keywords)
             return None
     
     def get_recent_trees(self, limit: int = 10) -> List[Dict]:
         """获取最近的生成树"""
-        with self._get_connection() as conn:
+        with self._conn() as conn:
             trees_data = conn.execute('''
                 SELECT tree_id, root_prompt, created_at, status
                 FROM trees 
@@ -445,65 +1115,45 @@ class TreeDatabase:
     def delete_tree(self, tree_id: str) -> bool:
         """删除生成树及其所有相关数据"""
         try:
-            with self._get_connection() as conn:
-                # 获取所有节点的图像路径，用于删除文件
-                image_paths = conn.execute('''
-                    SELECT image_path FROM nodes 
+            with self._conn(write=True) as conn:
+                # 图像文件都在树的专用文件夹中，这里只统计数量用于日志
+                image_count = conn.execute('''
+                    SELECT COUNT(*) FROM nodes 
                     WHERE tree_id = ? AND image_path IS NOT NULL
-                ''', (tree_id,)).fetchall()
-                
-                # 删除相关的任务记录
-                conn.execute('''
-                    DELETE FROM generation_tasks WHERE tree_id = ?
-                ''', (tree_id,))
-                
-                # 删除所有节点
-                conn.execute('''
-                    DELETE FROM nodes WHERE tree_id = ?
-                ''', (tree_id,))
+                ''', (tree_id,)).fetchone()[0]
                 
-                # 删除树记录
+                # 删除树记录，节点、图像数据和任务记录由外键级联删除
                 conn.execute('''
                     DELETE FROM trees WHERE tree_id = ?
                 ''', (tree_id,))
                 
                 conn.commit()
+                self._bump_data_version()
                 
-                # 删除图像文件
-                deleted_files = 0
-                for (image_path,) in image_paths:
-                    try:
-                        if image_path and Path(image_path).exists():
-                            Path(image_path).unlink()
-                            deleted_files += 1
-                    except Exception as e:
-                        logger.warning(f"删除图像文件失败 {image_path}: {e}")
-                
-                # 尝试删除树的专用文件夹
-                try:
-                    tree_folder = Path("web_generated_images") / f"tree_{tree_id}"
-                    if tree_folder.exists():
-                        import shutil
-                        shutil.rmtree(tree_folder)
-                        logger.info(f"已删除树文件夹: {tree_folder}")
-                except Exception as e:
-                    logger.warning(f"删除树文件夹失败: {e}")
-                
-                logger.info(f"成功删除树 {tree_id}，删除了 {deleted_files} 个图像文件")
+                self._remove_tree_files(tree_id)
+                logger.info(f"成功删除树 {tree_id}，删除了 {image_count} 个图像文件")
                 return True
                 
         except Exception as e:
             logger.error(f"删除树失败 {tree_id}: {e}")
             return False
     
+    def _remove_tree_files(self, tree_id: str):
+        """删除树的专用文件夹（图像和缩略图都在其中），一次目录遍历完成"""
+        tree_folder = Path("web_generated_images") / f"tree_{tree_id}"
+        shutil.rmtree(tree_folder, ignore_errors=True)
+    
     def save_user_setting(self, key: str, value: Any):
         """保存用户设置"""
         try:
-            with self._get_connection() as conn:
+            with self._conn(write=True) as conn:
                 conn.execute('''
-                    INSERT OR REPLACE INTO user_settings (setting_key, setting_value, updated_at)
+                    INSERT INTO user_settings (setting_key, setting_value, updated_at)
                     VALUES (?, ?, CURRENT_TIMESTAMP)
-                ''', (key, json.dumps(value)))
+                    ON CONFLICT(setting_key) DO UPDATE SET
+                        setting_value = excluded.setting_value,
+                        updated_at = CURRENT_TIMESTAMP
+                ''', (key, _dumps(value)))
                 conn.commit()
                 logger.info(f"用户设置已保存: {key}")
         except Exception as e:
@@ -512,13 +1162,13 @@ class TreeDatabase:
     def get_user_setting(self, key: str, default_value: Any = None) -> Any:
         """获取用户设置"""
         try:
-            with self._get_connection() as conn:
+            with self._conn() as conn:
                 result = conn.execute('''
                     SELECT setting_value FROM user_settings WHERE setting_key = ?
                 ''', (key,)).fetchone()
                 
                 if result:
-                    return json.loads(result[0])
+                    return _loads(result[0])
                 return default_value
         except Exception as e:
             logger.error(f"获取用户设置失败 {key}: {e}")
@@ -527,7 +1177,7 @@ class TreeDatabase:
     def get_all_user_settings(self) -> Dict[str, Any]:
         """获取所有用户设置"""
         try:
-            with self._get_connection() as conn:
+            with self._conn() as conn:
                 results = conn.execute('''
                     SELECT setting_key, setting_value FROM user_settings
                 ''').fetchall()
@@ -535,7 +1185,7 @@ class TreeDatabase:
                 settings = {}
                 for key, value in results:
                     try:
-                        settings[key] = json.loads(value)
+                        settings[key] = _loads(value)
                     except json.JSONDecodeError:
                         logger.warning(f"设置值解析失败: {key}")
                         continue
@@ -547,65 +1197,50 @@ class TreeDatabase:
     
     def cleanup_old_data(self, days: int = 30):
         """清理旧数据"""
-        with self._get_connection() as conn:
+        cutoff = _cutoff_timestamp(days)
+        with self._conn(write=True) as conn:
+            # 两条删除在同一个事务中提交
+            
             # 清理旧的已完成任务
             conn.execute('''
                 DELETE FROM generation_tasks 
                 WHERE status = 'completed' 
-                AND datetime(completed_at) < datetime('now', '-{} days')
-            '''.format(days))
+                AND completed_at < ?
+            ''', (cutoff,))
             
             # 清理低使用频率的关键词缓存
             conn.execute('''
-                DELETE FROM keyword_cache 
+                DELETE FROM kc.keyword_cache 
                 WHERE usage_count = 1 
-                AND datetime(created_at) < datetime('now', '-{} days')
-            '''.format(days))
+                AND created_at < ?
+            ''', (cutoff,))
             
             conn.commit()
+        self._keyword_cache.clear()
     
     def get_database_stats(self) -> Dict[str, Any]:
         """获取数据库统计信息"""
-        with self._get_connection() as conn:
+        with self._conn() as conn:
             # 获取数据库文件大小
             db_size = Path(self.db_path).stat().st_size if Path(self.db_path).exists() else 0
             
-            # 获取各表的记录数
-            trees_count = conn.execute('SELECT COUNT(*) FROM trees').fetchone()[0]
-            nodes_count = conn.execute('SELECT COUNT(*) FROM nodes').fetchone()[0]
-            tasks_count = conn.execute('SELECT COUNT(*) FROM generation_tasks').fetchone()[0]
-            cache_count = conn.execute('SELECT COUNT(*) FROM keyword_cache').fetchone()[0]
-            
-            # 获取有图像数据的节点数
-            nodes_with_images = conn.execute('''
-                SELECT COUNT(*) FROM nodes WHERE image_data IS NOT NULL
-            ''').fetchone()[0]
-            
-            # 获取图像数据总大小（估算）
-            image_data_size = conn.execute('''
-                SELECT SUM(LENGTH(image_data)) FROM nodes WHERE image_data IS NOT NULL
-            ''').fetchone()[0] or 0
-            
-            # 获取最老的记录
-            oldest_tree = conn.execute('''
-                SELECT created_at FROM trees ORDER BY created_at ASC LIMIT 1
+            # 所有统计在一条查询中返回；每项单独的标量子查询都能走索引：
+            # MIN/MAX 走 idx_trees_created 只读一行，按状态计数走 idx_tasks_status_completed 的范围
+            (trees_count, oldest_tree, newest_tree, nodes_count, nodes_with_images, image_data_size,
+             tasks_count, failed_tasks, pending_tasks, cache_count) = conn.execute('''
+                SELECT (SELECT COUNT(*) FROM trees),
+                       (SELECT MIN(created_at) FROM trees),
+                       (SELECT MAX(created_at) FROM trees),
+                       (SELECT COUNT(*) FROM nodes),
+                       i.nodes_with_images, i.image_data_size,
+                       (SELECT COUNT(*) FROM generation_tasks),
+                       (SELECT COUNT(*) FROM generation_tasks WHERE status = 'failed'),
+                       (SELECT COUNT(*) FROM generation_tasks WHERE status = 'pending'),
+                       (SELECT COUNT(*) FROM kc.keyword_cache)
+                FROM (SELECT COUNT(*) AS nodes_with_images,
+                             COALESCE(SUM(LENGTH(image_data)), 0) AS image_data_size FROM node_images) i
             ''').fetchone()
             
-            # 获取最新的记录
-            newest_tree = conn.execute('''
-                SELECT created_at FROM trees ORDER BY created_at DESC LIMIT 1
-            ''').fetchone()
-            
-            # 获取失败的任务数
-            failed_tasks = conn.execute('''
-                SELECT COUNT(*) FROM generation_tasks WHERE status = 'failed'
-            ''').fetchone()[0]
-            
-            # 获取待处理的任务数
-            pending_tasks = conn.execute('''
-                SELECT COUNT(*) FROM generation_tasks WHERE status = 'pending'
-            ''').fetchone()[0]
-            
             return {
                 'database_size': db_size,
                 'database_size_mb': round(db_size / (1024 * 1024), 2),
@@ -618,56 +1253,68 @@ class TreeDatabase:
                 'image_data_size_mb': round(image_data_size / (1024 * 1024), 2),
                 'failed_tasks': failed_tasks,
                 'pending_tasks': pending_tasks,
-                'oldest_tree': oldest_tree[0] if oldest_tree else None,
-                'newest_tree': newest_tree[0] if newest_tree else None
+                'oldest_tree': oldest_tree,
+                'newest_tree': newest_tree
             }
     
     def cleanup_image_data(self, keep_recent_days: int = 7) -> Dict[str, int]:
         """清理图像数据（保留最近N天的数据）"""
-        with self._get_connection() as conn:
-            # 获取要清理的节点
-            nodes_to_clean = conn.execute('''
-                SELECT node_id, tree_id FROM nodes 
-                WHERE image_data IS NOT NULL 
-                AND datetime(created_at) < datetime('now', '-{} days')
-            '''.format(keep_recent_days)).fetchall()
-            
-            cleaned_count = 0
-            for node_id, tree_id in nodes_to_clean:
-                # 只清除image_data，保留image_path引用
-                conn.execute('''
-                    UPDATE nodes SET image_data = NULL 
-                    WHERE node_id = ?
-                ''', (node_id,))
-                cleaned_count += 1
+        with self._conn(write=True) as conn:
+            # 只清除图像数据，保留image_path引用
+            cleaned_count = conn.execute('''
+                DELETE FROM node_images 
+                WHERE node_id IN (
+                    SELECT node_id FROM nodes 
+                    WHERE created_at < ?
+                )
+            ''', (_cutoff_timestamp(keep_recent_days),)).rowcount
             
             conn.commit()
+            self._bump_data_version()
             
             return {
                 'cleaned_nodes': cleaned_count,
                 'message': f'已清理 {cleaned_count} 个节点的图像数据（保留了最近{keep_recent_days}天的数据）'
             }
     
+    def _reclaim_space(self) -> bool:
+        """回收空闲页：先增量回收，仍有大量空闲页时再执行完整 VACUUM
+
+        旧数据库未启用 auto_vacuum = INCREMENTAL，增量回收不起作用；
+        完整 VACUUM 会按引导时设置的模式重建文件，之后即可走增量回收。
+        返回是否执行了完整 VACUUM。
+        """
+        with self._conn(write=True, transaction=False) as conn:
+            # execute 只单步执行一次（只回收一页），executescript 会执行到结束
+            conn.executescript('PRAGMA incremental_vacuum;')
+            freelist_count = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            full_vacuum = freelist_count > VACUUM_FREELIST_THRESHOLD
+            if full_vacuum:
+                conn.execute('VACUUM')
+            # WAL 模式下回收的页在检查点后才从文件中截掉
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return full_vacuum
+    
     def vacuum_database(self) -> Dict[str, Any]:
-        """优化数据库（VACUUM操作）"""
+        """优化数据库（优先增量回收，必要时执行完整 VACUUM）"""
         try:
             # 获取优化前的大小
             before_size = Path(self.db_path).stat().st_size if Path(self.db_path).exists() else 0
             
-            with self._get_connection() as conn:
-                conn.execute('VACUUM')
-                conn.commit()
+            full_vacuum = self._reclaim_space()
             
             # 获取优化后的大小
             after_size = Path(self.db_path).stat().st_size if Path(self.db_path).exists() else 0
             saved_size = before_size - after_size
             
+            mode = '完整 VACUUM' if full_vacuum else '增量回收'
             return {
                 'success': True,
+                'full_vacuum': full_vacuum,
                 'before_size_mb': round(before_size / (1024 * 1024), 2),
                 'after_size_mb': round(after_size / (1024 * 1024), 2),
                 'saved_size_mb': round(saved_size / (1024 * 1024), 2),
-                'message': f'数据库优化完成，节省了 {round(saved_size / (1024 * 1024), 2)} MB 空间'
+                'message': f'数据库优化完成（{mode}），节省了 {round(saved_size / (1024 * 1024), 2)} MB 空间'
             }
         except Exception as e:
             logger.error(f"数据库优化失败: {e}")
@@ -677,35 +1324,85 @@ class TreeDatabase:
                 'message': f'数据库优化失败: {str(e)}'
             }
     
+    def vacuum_incremental(self, pages: int = 0) -> Dict[str, Any]:
+        """增量回收空闲页（需 auto_vacuum = INCREMENTAL），不重写整个数据库文件
+
+        pages 为 0 时回收全部空闲页。
+        """
+        try:
+            before_size = Path(self.db_path).stat().st_size if Path(self.db_path).exists() else 0
+            
+            with self._conn(write=True, transaction=False) as conn:
+                # execute 只单步执行一次（只回收一页），executescript 会执行到结束
+                conn.executescript(f'PRAGMA incremental_vacuum({int(pages)});')
+                # WAL 模式下回收的页在检查点后才从文件中截掉
+                conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            
+            after_size = Path(self.db_path).stat().st_size if Path(self.db_path).exists() else 0
+            saved_size = before_size - after_size
+            
+            return {
+                'success': True,
+                'before_size_mb': round(before_size / (1024 * 1024), 2),
+                'after_size_mb': round(after_size / (1024 * 1024), 2),
+                'saved_size_mb': round(saved_size / (1024 * 1024), 2),
+                'message': f'增量回收完成，节省了 {round(saved_size / (1024 * 1024), 2)} MB 空间'
+            }
+        except Exception as e:
+            logger.error(f"增量回收失败: {e}")
+            return {
+                'success': False,
+                'error': str(e),
+                'message': f'增量回收失败: {str(e)}'
+            }
+    
+    def _delete_in_batches(self, sql: str) -> int:
+        """分批执行删除语句（语句中以 LIMIT ? 限定每批行数），直到没有可删除的行
+
+        每批在单独的事务中提交，批次之间释放写锁，其他写操作可以插入执行。
+        """
+        deleted_count = 0
+        while True:
+            with self._conn(write=True) as conn:
+                batch_count = conn.execute(sql, (CLEANUP_BATCH_SIZE,)).rowcount
+            deleted_count += batch_count
+            if batch_count < CLEANUP_BATCH_SIZE:
+                return deleted_count
+    
     def cleanup_failed_tasks(self) -> int:
         """清理失败的任务记录"""
-        with self._get_connection() as conn:
-            result = conn.execute('''
-                DELETE FROM generation_tasks WHERE status = 'failed'
-            ''')
-            deleted_count = result.rowcount
-            conn.commit()
-            return deleted_count
+        return self._delete_in_batches('''
+            DELETE FROM generation_tasks WHERE rowid IN (
+                SELECT rowid FROM generation_tasks WHERE status = 'failed' LIMIT ?
+            )
+        ''')
     
     def cleanup_orphaned_nodes(self) -> int:
-        """清理孤立节点（没有关联树的节点）"""
-        with self._get_connection() as conn:
-            result = conn.execute('''
-                DELETE FROM nodes 
-                WHERE tree_id NOT IN (SELECT tree_id FROM trees)
-            ''')
-            deleted_count = result.rowcount
-            conn.commit()
-            return deleted_count
+        """清理孤立节点（没有关联树的节点）
+
+        启用级联删除后删除树不会再留下孤立节点，这里用于兜底检查。
+        """
+        deleted_count = self._delete_in_batches('''
+            DELETE FROM nodes WHERE rowid IN (
+                SELECT n.rowid FROM nodes n
+                LEFT JOIN trees t ON t.tree_id = n.tree_id
+                WHERE t.tree_id IS NULL
+                LIMIT ?
+            )
+        ''')
+        if deleted_count:
+            self._bump_data_version()
+        return deleted_count
     
     def get_large_trees(self, min_nodes: int = 20) -> List[Dict]:
         """获取大型树（节点数超过阈值）"""
-        with self._get_connection() as conn:
+        with self._conn() as conn:
             results = conn.execute('''
                 SELECT t.tree_id, t.root_prompt, t.created_at, COUNT(n.node_id) as node_count,
-                       SUM(CASE WHEN n.image_data IS NOT NULL THEN LENGTH(n.image_data) ELSE 0 END) as total_image_size
+                       SUM(CASE WHEN i.image_data IS NOT NULL THEN LENGTH(i.image_data) ELSE 0 END) as total_image_size
                 FROM trees t
                 LEFT JOIN nodes n ON t.tree_id = n.tree_id
+                LEFT JOIN node_images i ON n.node_id = i.node_id
                 GROUP BY t.tree_id
                 HAVING node_count >= ?
                 ORDER BY node_count DESC
@@ -724,70 +1421,140 @@ class TreeDatabase:
     
     def export_tree_metadata(self, tree_id: str) -> Optional[Dict]:
         """导出树的元数据（不包含图像数据）"""
-        tree = self.get_tree(tree_id)
+        tree = self.get_tree_info(tree_id)
         if not tree:
             return None
         
-        # 移除图像数据，只保留元数据
-        for node_id, node in tree['nodes'].items():
-            node['image_data'] = None  # 不导出图像数据
+        tree['nodes'] = {node['node_id']: node for node in self.iter_tree_metadata(tree_id)}
+        return tree
+    
+    def iter_tree_metadata(self, tree_id: str) -> Iterator[Dict]:
+        """逐个产出导出用的节点元数据，供流式导出使用"""
+        for node in self.iter_tree_nodes(tree_id):
+            # 节点数据本身不含图像数据，只标记是否有图像
             node['has_image'] = bool(node.get('image_path'))
+            yield node
+    
+    def import_tree_metadata(self, metadata: Dict) -> int:
+        """导入 export_tree_metadata 导出的树（不含图像数据），返回导入的节点数
+
+        节点按导出顺序（创建顺序）插入，父节点总在子节点之前。
+        """
+        tree_id = metadata['tree_id']
+        nodes = metadata['nodes']
+        root_prompt = nodes[metadata['root_id']]['prompt'] if metadata.get('root_id') else ''
         
-        return tree
+        with self._conn(write=True) as conn:
+            # 树和全部节点在一个事务中写入，只提交一次
+            if conn.execute('SELECT 1 FROM trees WHERE tree_id = ?', (tree_id,)).fetchone():
+                raise ValueError(f"树已存在: {tree_id}")
+            
+            conn.execute('''
+                INSERT INTO trees (tree_id, root_prompt, created_at, status, metadata)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (tree_id, root_prompt, metadata.get('created_at'), metadata.get('status', 'active'),
+                  _dumps(metadata.get('metadata') or {})))
+            
+            # 由生成器逐行提供参数，不先构造完整的行列表
+            conn.executemany('''
+                INSERT INTO nodes (node_id, tree_id, parent_id, prompt, image_path, keywords,
+                                   quality_score, accuracy_score, status, branch_info, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                (node['node_id'], tree_id, node.get('parent_id'), node['prompt'], node.get('image_path'),
+                 _pack_json(node['keywords']) if node.get('keywords') else None,
+                 node.get('quality_score', 0.0), node.get('accuracy_score', 0.0),
+                 node.get('status', 'pending'),
+                 _dumps(node['branch_info']) if node.get('branch_info') else None,
+                 node.get('created_at'))
+                for node in nodes.values()
+            ))
+        
+        self._bump_data_version()
+        return len(nodes)
     
     def batch_delete_old_trees(self, days: int = 30, keep_count: int = 10) -> Dict[str, Any]:
         """批量删除旧树（保留最近N个）"""
-        with self._get_connection() as conn:
+        deleted_nodes = 0
+        with self._conn(write=True) as conn:
+            # 所有删除在一个事务中完成，只提交一次
+            
             # 获取要删除的树ID
-            trees_to_delete = conn.execute('''
+            tree_ids = [row[0] for row in conn.execute('''
                 SELECT tree_id FROM trees 
-                WHERE datetime(created_at) < datetime('now', '-{} days')
+                WHERE created_at < ?
                 AND tree_id NOT IN (
                     SELECT tree_id FROM trees 
                     ORDER BY created_at DESC 
-                    LIMIT {}
+                    LIMIT ?
                 )
-            '''.format(days, keep_count)).fetchall()
-            
-            deleted_count = 0
-            deleted_nodes = 0
+            ''', (_cutoff_timestamp(days), keep_count))]
             
-            for (tree_id,) in trees_to_delete:
-                # 获取节点数
-                node_count = conn.execute('''
-                    SELECT COUNT(*) FROM nodes WHERE tree_id = ?
-                ''', (tree_id,)).fetchone()[0]
+            # 分批拼接 IN 参数，避免超过 SQLite 的变量数上限
+            for start in range(0, len(tree_ids), 500):
+                chunk = tree_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                
+                deleted_nodes += conn.execute(f'''
+                    SELECT COUNT(*) FROM nodes WHERE tree_id IN ({placeholders})
+                ''', chunk).fetchone()[0]
                 
-                # 删除树
-                if self.delete_tree(tree_id):
-                    deleted_count += 1
-                    deleted_nodes += node_count
+                # 节点、图像数据和任务记录由外键级联删除
+                conn.execute(f'DELETE FROM trees WHERE tree_id IN ({placeholders})', chunk)
             
-            return {
-                'deleted_trees': deleted_count,
-                'deleted_nodes': deleted_nodes,
-                'message': f'已删除 {deleted_count} 个旧树，共 {deleted_nodes} 个节点'
-            }
+            conn.commit()
+        
+        deleted_count = len(tree_ids)
+        if deleted_count:
+            self._bump_data_version()
+        
+        # 事务提交后再删除磁盘文件
+        for tree_id in tree_ids:
+            self._remove_tree_files(tree_id)
+        
+        return {
+            'deleted_trees': deleted_count,
+            'deleted_nodes': deleted_nodes,
+            'message': f'已删除 {deleted_count} 个旧树，共 {deleted_nodes} 个节点'
+        }
     
     def reset_database(self) -> Dict[str, Any]:
-        """重置数据库：清空所有数据并收缩数据库"""
+        """重置数据库：在内存中建立只含用户配置的新库，再用备份 API 整体覆盖原数据库
+
+        不逐表删除再 VACUUM，开销只与保留的行数有关，覆盖后的文件本身也没有碎片。
+        覆盖经由写连接完成并持有数据库写锁，不替换文件本身，其他进程的连接依然有效。
+        """
         try:
             # 获取重置前的大小
             before_size = Path(self.db_path).stat().st_size if Path(self.db_path).exists() else 0
             
-            with self._get_connection() as conn:
-                # 清空所有表
-                conn.execute('DELETE FROM generation_tasks')
-                conn.execute('DELETE FROM nodes')
-                conn.execute('DELETE FROM trees')
-                conn.execute('DELETE FROM keyword_cache')
-                # 保留 user_settings 表，不删除用户配置
-                
-                conn.commit()
-                
-                # 执行 VACUUM 收缩数据库
-                conn.execute('VACUUM')
-                conn.commit()
+            # 排队中的写操作先落盘，避免覆盖后又被写回
+            self.flush()
+            
+            fresh = sqlite3.connect(':memory:')
+            try:
+                with self._conn(write=True, transaction=False) as conn:
+                    # WAL 模式的目标库要求备份前后页大小一致
+                    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+                    fresh.execute(f'PRAGMA page_size = {int(page_size)}')
+                    self._init_schema(fresh)
+                    # 保留 user_settings 表，不删除用户配置
+                    settings = conn.execute(
+                        'SELECT setting_key, setting_value, updated_at FROM user_settings'
+                    ).fetchall()
+                    with fresh:
+                        fresh.executemany('''
+                            INSERT INTO user_settings (setting_key, setting_value, updated_at)
+                            VALUES (?, ?, ?)
+                        ''', settings)
+                    fresh.backup(conn)
+                    conn.execute('DELETE FROM kc.keyword_cache')
+                    # WAL 模式下覆盖写入的页在检查点后才从文件中截掉
+                    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            finally:
+                fresh.close()
+            self._bump_data_version()
+            self._keyword_cache.clear()
             
             # 获取重置后的大小
             after_size = Path(self.db_path).stat().st_size if Path(self.db_path).exists() else 0
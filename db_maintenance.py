@@ -22,11 +22,23 @@ if sys.platform.startswith('win'):
 
 import argparse
 from pathlib import Path
-from database import db
 import json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _dump_json(obj) -> str:
+    """序列化为 JSON 文本（保留非 ASCII 字符），安装了 orjson 时使用 orjson"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False)
+
 def print_stats():
     """显示数据库统计信息"""
+    from database import db
+    
     print("\n" + "="*60)
     print("📊 数据库统计信息")
     print("="*60)
@@ -61,6 +73,8 @@ def print_stats():
 
 def cleanup_image_data(keep_days=7):
     """清理图像数据"""
+    from database import db
+    
     print(f"\n🗑️ 清理 {keep_days} 天前的图像数据...")
     
     result = db.cleanup_image_data(keep_days)
@@ -70,6 +84,8 @@ def cleanup_image_data(keep_days=7):
 
 def cleanup_old_data(days=30):
     """清理旧数据"""
+    from database import db
+    
     print(f"\n🗑️ 清理 {days} 天前的旧数据...")
     
     db.cleanup_old_data(days)
@@ -77,6 +93,8 @@ def cleanup_old_data(days=30):
 
 def cleanup_failed_tasks():
     """清理失败的任务"""
+    from database import db
+    
     print("\n🧹 清理失败的任务记录...")
     
     deleted = db.cleanup_failed_tasks()
@@ -86,6 +104,8 @@ def cleanup_failed_tasks():
 
 def cleanup_orphaned_nodes():
     """清理孤立节点"""
+    from database import db
+    
     print("\n🧹 清理孤立节点...")
     
     deleted = db.cleanup_orphaned_nodes()
@@ -95,8 +115,10 @@ def cleanup_orphaned_nodes():
 
 def vacuum_database():
     """优化数据库"""
-    print("\n⚡ 优化数据库 (VACUUM)...")
-    print("   这可能需要几分钟时间，请耐心等待...")
+    from database import db
+    
+    print("\n⚡ 优化数据库...")
+    print("   通常只需增量回收空闲页；旧数据库首次优化会执行完整 VACUUM，可能需要几分钟...")
     
     result = db.vacuum_database()
     
@@ -112,6 +134,8 @@ def vacuum_database():
 
 def show_large_trees(min_nodes=20):
     """显示大型树"""
+    from database import db
+    
     print(f"\n📊 大型树列表 (节点数 >= {min_nodes}):")
     print("="*80)
     
@@ -132,6 +156,8 @@ def show_large_trees(min_nodes=20):
 
 def batch_delete_old_trees(days=30, keep_count=10):
     """批量删除旧树"""
+    from database import db
+    
     print(f"\n🗑️ 批量删除旧树...")
     print(f"   删除 {days} 天前的树，保留最近 {keep_count} 个")
     
@@ -178,94 +204,107 @@ def full_cleanup():
 
 def export_metadata(tree_id, output_file):
     """导出树的元数据"""
+    from database import db
+    
     print(f"\n📤 导出树元数据: {tree_id}")
     
-    metadata = db.export_tree_metadata(tree_id)
+    tree = db.get_tree_info(tree_id)
     
-    if not metadata:
+    if not tree:
         print(f"❌ 树不存在: {tree_id}")
         return False
     
+    # 逐个节点写出，不在内存中构造整棵树；格式与 export_tree_metadata 的结果一致
     with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(metadata, f, ensure_ascii=False, indent=2)
+        f.write('{\n')
+        for key, value in tree.items():
+            f.write(f'  {_dump_json(key)}: {_dump_json(value)},\n')
+        f.write('  "nodes": {')
+        for index, node in enumerate(db.iter_tree_metadata(tree_id)):
+            f.write(',\n' if index else '\n')
+            f.write(f'    {_dump_json(node["node_id"])}: {_dump_json(node)}')
+        f.write('\n  }\n}\n')
     
     print(f"✅ 元数据已导出到: {output_file}")
     return True
 
+def import_metadata(input_file):
+    """导入树的元数据"""
+    from database import db
+    
+    print(f"\n📥 导入树元数据: {input_file}")
+    
+    with open(input_file, 'r', encoding='utf-8') as f:
+        metadata = json.load(f)
+    
+    count = db.import_tree_metadata(metadata)
+    
+    print(f"✅ 已导入树 {metadata['tree_id']}，共 {count} 个节点")
+    return True
+
+# 子命令 -> 处理函数；只执行选中的命令，数据库模块在命令函数中才导入
+COMMANDS = {
+    'stats': lambda args: print_stats(),
+    'cleanup-images': lambda args: cleanup_image_data(args.days),
+    'cleanup-old': lambda args: cleanup_old_data(args.days),
+    'cleanup-failed': lambda args: cleanup_failed_tasks(),
+    'cleanup-orphaned': lambda args: cleanup_orphaned_nodes(),
+    'vacuum': lambda args: vacuum_database(),
+    'full-cleanup': lambda args: full_cleanup(),
+    'large-trees': lambda args: show_large_trees(args.min_nodes),
+    'batch-delete': lambda args: batch_delete_old_trees(args.days, args.keep),
+    'export-metadata': lambda args: export_metadata(args.tree_id, args.output),
+    'import-metadata': lambda args: import_metadata(args.input),
+}
+
 def main():
     parser = argparse.ArgumentParser(
         description='数据库维护工具 - 管理 tree_generator.db',
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 示例用法:
-  %(prog)s --stats                    # 显示数据库统计信息
-  %(prog)s --cleanup-images 7         # 清理7天前的图像数据
-  %(prog)s --cleanup-old 30           # 清理30天前的旧数据
-  %(prog)s --vacuum                   # 优化数据库
-  %(prog)s --full-cleanup             # 执行完整清理流程
-  %(prog)s --large-trees 20           # 显示节点数>=20的大型树
-  %(prog)s --batch-delete 30 10       # 批量删除30天前的树，保留最近10个
+  %(prog)s stats                      # 显示数据库统计信息
+  %(prog)s cleanup-images 7           # 清理7天前的图像数据
+  %(prog)s cleanup-old 30             # 清理30天前的旧数据
+  %(prog)s vacuum                     # 优化数据库
+  %(prog)s full-cleanup               # 执行完整清理流程
+  %(prog)s large-trees 20             # 显示节点数>=20的大型树
+  %(prog)s batch-delete 30 10         # 批量删除30天前的树，保留最近10个
+  %(prog)s import-metadata tree.json  # 从导出的元数据文件导入树
         """
     )
     
-    parser.add_argument('--stats', action='store_true',
-                        help='显示数据库统计信息')
-    parser.add_argument('--cleanup-images', type=int, metavar='DAYS',
-                        help='清理N天前的图像数据')
-    parser.add_argument('--cleanup-old', type=int, metavar='DAYS',
-                        help='清理N天前的旧数据')
-    parser.add_argument('--cleanup-failed', action='store_true',
-                        help='清理失败的任务记录')
-    parser.add_argument('--cleanup-orphaned', action='store_true',
-                        help='清理孤立节点')
-    parser.add_argument('--vacuum', action='store_true',
-                        help='优化数据库 (VACUUM)')
-    parser.add_argument('--full-cleanup', action='store_true',
-                        help='执行完整清理流程')
-    parser.add_argument('--large-trees', type=int, metavar='MIN_NODES',
-                        help='显示大型树列表')
-    parser.add_argument('--batch-delete', nargs=2, type=int, metavar=('DAYS', 'KEEP'),
-                        help='批量删除旧树')
-    parser.add_argument('--export-metadata', nargs=2, metavar=('TREE_ID', 'OUTPUT'),
-                        help='导出树的元数据')
+    subparsers = parser.add_subparsers(dest='command', metavar='COMMAND')
+    
+    subparsers.add_parser('stats', help='显示数据库统计信息')
+    sub = subparsers.add_parser('cleanup-images', help='清理N天前的图像数据')
+    sub.add_argument('days', type=int, nargs='?', default=7, metavar='DAYS')
+    sub = subparsers.add_parser('cleanup-old', help='清理N天前的旧数据')
+    sub.add_argument('days', type=int, nargs='?', default=30, metavar='DAYS')
+    subparsers.add_parser('cleanup-failed', help='清理失败的任务记录')
+    subparsers.add_parser('cleanup-orphaned', help='清理孤立节点')
+    subparsers.add_parser('vacuum', help='优化数据库（回收空闲空间）')
+    subparsers.add_parser('full-cleanup', help='执行完整清理流程')
+    sub = subparsers.add_parser('large-trees', help='显示大型树列表')
+    sub.add_argument('min_nodes', type=int, nargs='?', default=20, metavar='MIN_NODES')
+    sub = subparsers.add_parser('batch-delete', help='批量删除旧树')
+    sub.add_argument('days', type=int, metavar='DAYS')
+    sub.add_argument('keep', type=int, metavar='KEEP')
+    sub = subparsers.add_parser('export-metadata', help='导出树的元数据')
+    sub.add_argument('tree_id', metavar='TREE_ID')
+    sub.add_argument('output', metavar='OUTPUT')
+    sub = subparsers.add_parser('import-metadata', help='导入 export-metadata 导出的树元数据')
+    sub.add_argument('input', metavar='INPUT')
     
     args = parser.parse_args()
     
-    # 如果没有参数，显示帮助
-    if len(sys.argv) == 1:
+    # 如果没有指定命令，显示帮助
+    if args.command is None:
         parser.print_help()
         return
     
     try:
-        if args.stats:
-            print_stats()
-        
-        if args.cleanup_images:
-            cleanup_image_data(args.cleanup_images)
-        
-        if args.cleanup_old:
-            cleanup_old_data(args.cleanup_old)
-        
-        if args.cleanup_failed:
-            cleanup_failed_tasks()
-        
-        if args.cleanup_orphaned:
-            cleanup_orphaned_nodes()
-        
-        if args.vacuum:
-            vacuum_database()
-        
-        if args.full_cleanup:
-            full_cleanup()
-        
-        if args.large_trees:
-            show_large_trees(args.large_trees)
-        
-        if args.batch_delete:
-            batch_delete_old_trees(args.batch_delete[0], args.batch_delete[1])
-        
-        if args.export_metadata:
-            export_metadata(args.export_metadata[0], args.export_metadata[1])
+        COMMANDS[args.command](args)
         
         print("\n✅ 操作完成！\n")
         
@@ -29,8 +29,23 @@ if sys.platform.startswith('win'):
 
 import json
 from pathlib import Path
-from typing import Dict, Any, Optional
-from flask import session, request
+from typing import Dict, Any, Optional, Iterator, Tuple
+from flask import session, request, g
+
+# 安装了 orjson 时用它解析翻译文件
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+def _flatten(translations: Dict[str, Any], prefix: str = '') -> Iterator[Tuple[str, str]]:
+    """把嵌套的翻译字典展开为 ('app.title', '...') 形式的键值对"""
+    for key, value in translations.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}.")
+        else:
+            yield f"{prefix}{key}", str(value)
 
 class I18nManager:
     """国际化管理器"""
@@ -39,31 +54,69 @@ class I18nManager:
         self.i18n_dir = Path(i18n_dir)
         self.default_locale = default_locale
         self.translations: Dict[str, Dict[str, Any]] = {}
+        # 语言 -> 翻译文件，文件在首次用到该语言时才读取
+        self._locale_files: Dict[str, Path] = {}
+        # 展开后的翻译（'app.title' -> 文本），查找时只需一次字典访问
+        self._flat: Dict[str, Dict[str, str]] = {}
         self.supported_locales = []
+        # 语言前缀 -> 支持的语言，如 'zh' -> 'zh_CN'
+        self._locale_prefix_map: Dict[str, str] = {}
         self.load_translations()
     
     def load_translations(self):
-        """加载所有翻译文件"""
+        """查找所有翻译文件（只登记文件，内容在首次使用时加载）"""
         if not self.i18n_dir.exists():
             print(f"Warning: i18n directory {self.i18n_dir} does not exist")
             return
         
         for file_path in self.i18n_dir.glob("*.json"):
-            locale = file_path.stem
-            try:
-                # 强制使用UTF-8编码读取翻译文件
-                with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                    self.translations[locale] = json.load(f)
-                self.supported_locales.append(locale)
-                print(f"Loaded translations for locale: {locale}")
-            except Exception as e:
-                print(f"Error loading translations for {locale}: {e}")
+            self._locale_files[file_path.stem] = file_path
+            self.supported_locales.append(file_path.stem)
         
         if not self.supported_locales:
             print("Warning: No translation files loaded")
+        
+        for locale in self.supported_locales:
+            self._locale_prefix_map.setdefault(locale.split('_')[0], locale)
+    
+    def _load_locale(self, locale: str) -> Dict[str, str]:
+        """读取并展开单个语言的翻译文件，返回展开后的翻译"""
+        file_path = self._locale_files.get(locale)
+        if file_path is None:
+            return {}
+        
+        try:
+            # 强制使用UTF-8编码读取翻译文件
+            translations = _loads(file_path.read_bytes().decode('utf-8', errors='replace'))
+            print(f"Loaded translations for locale: {locale}")
+        except Exception as e:
+            # 记为空翻译，避免每次调用都重新读取出错的文件
+            print(f"Error loading translations for {locale}: {e}")
+            translations = {}
+        
+        self.translations[locale] = translations
+        self._flat[locale] = flat = dict(_flatten(translations))
+        return flat
+    
+    def get_translations(self, locale: str) -> Dict[str, Any]:
+        """获取指定语言的完整（嵌套）翻译"""
+        if locale not in self.translations:
+            self._load_locale(locale)
+        return self.translations.get(locale, {})
     
     def get_current_locale(self) -> str:
-        """获取当前语言环境"""
+        """获取当前语言环境（每个请求只解析一次，结果缓存在 flask.g 中）"""
+        try:
+            if 'locale' in g.__dict__:
+                return g.locale
+            g.locale = self._resolve_locale()
+            return g.locale
+        except RuntimeError:
+            # 在Flask应用上下文之外，每次重新解析
+            return self._resolve_locale()
+    
+    def _resolve_locale(self) -> str:
+        """从 session、Accept-Language 头依次解析语言环境"""
         # 1. 从 session 中获取用户选择的语言
         try:
             if 'locale' in session:
@@ -83,10 +136,9 @@ class I18nManager:
                     if locale in self.supported_locales:
                         return locale
                     # 尝试匹配语言前缀，如 'zh' 匹配 'zh_CN'
-                    lang_prefix = locale.split('_')[0]
-                    for supported in self.supported_locales:
-                        if supported.startswith(lang_prefix):
-                            return supported
+                    supported = self._locale_prefix_map.get(locale.split('_')[0])
+                    if supported:
+                        return supported
         except RuntimeError:
             # 在Flask请求上下文之外，跳过request检查
             pass
@@ -99,6 +151,8 @@ class I18nManager:
         if locale in self.supported_locales:
             try:
                 session['locale'] = locale
+                # 同一请求中后续的翻译使用新语言
+                g.locale = locale
                 return True
             except RuntimeError:
                 # 在Flask请求上下文之外，无法设置session
@@ -111,32 +165,32 @@ class I18nManager:
         if locale is None:
             locale = self.get_current_locale()
         
-        # 如果指定的语言不存在，使用默认语言
-        if locale not in self.translations:
-            locale = self.default_locale
-        
-        # 如果默认语言也不存在，返回原始key
-        if locale not in self.translations:
-            return key
-        
-        # 支持嵌套key，如 'app.title'
-        translation_dict = self.translations[locale]
-        keys = key.split('.')
-        
-        try:
-            for k in keys:
-                translation_dict = translation_dict[k]
-            
-            # 支持字符串格式化
-            if isinstance(translation_dict, str) and kwargs:
-                return translation_dict.format(**kwargs)
+        # 如果语言或key不存在，尝试从默认语言获取，仍不存在时返回原始key
+        for candidate in (locale, self.default_locale):
+            # 支持嵌套key，如 'app.title'（加载时已展开）
+            flat = self._flat.get(candidate)
+            if flat is None:
+                flat = self._load_locale(candidate)
+            value = flat.get(key)
+            if value is not None:
+                # 支持字符串格式化
+                return value.format(**kwargs) if kwargs else value
             
-            return str(translation_dict)
+            # 展开表中没有的key可能指向整个分组（如 'app'），与逐级查找时一样返回其字符串形式
+            section = self._find_section(candidate, key)
+            if section is not None:
+                return str(section)
+        return key
+    
+    def _find_section(self, locale: str, key: str) -> Optional[Dict[str, Any]]:
+        """在嵌套翻译中逐级查找 key 指向的分组，不存在时返回 None"""
+        node = self.translations.get(locale, {})
+        try:
+            for k in key.split('.'):
+                node = node[k]
         except (KeyError, TypeError):
-            # 如果key不存在，尝试从默认语言获取
-            if locale != self.default_locale:
-                return self.get_translation(key, self.default_locale, **kwargs)
-            return key
+            return None
+        return node if isinstance(node, dict) else None
     
     def get_supported_locales(self) -> Dict[str, str]:
         """获取支持的语言列表"""
@@ -12,11 +12,22 @@ import json
 from pathlib import Path
 import shutil
 import platform
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# 下载时每次读取/写入的块大小（1MB）
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+# 同时下载的模型文件数
+MAX_PARALLEL_DOWNLOADS = 3
 
 class ComfyUIInstaller:
     def __init__(self):
         self.system = platform.system().lower()
         self.comfyui_dir = Path("ComfyUI")
+        # 并行下载时串行化输出，避免多个文件的进度互相穿插
+        self._print_lock = threading.Lock()
+        # 与克隆仓库同时进行的 pip 升级
+        self._pip_upgrade = None
         self.models_info = {
             "unet": {
                 "filename": "z_image_turbo_bf16.safetensors",
@@ -108,26 +119,50 @@ class ComfyUIInstaller:
             print(f"❌ 克隆失败: {e}")
             return False
     
+    def start_pip_upgrade(self):
+        """在后台升级 pip，与克隆仓库同时进行（两者互不依赖）
+
+        安装了 uv 时由 uv 安装依赖，不需要升级 pip。输出先收集起来，
+        避免与克隆进度和交互提示混在一起。
+        """
+        if shutil.which("uv"):
+            return
+        executor = ThreadPoolExecutor(max_workers=1)
+        self._pip_upgrade = executor.submit(subprocess.run, [
+            sys.executable, "-m", "pip", "install", "--upgrade", "pip"
+        ], capture_output=True, text=True)
+        executor.shutdown(wait=False)
+    
     def install_dependencies(self):
         """安装 Python 依赖"""
         print("\n📦 安装 Python 依赖...")
         
+        if self._pip_upgrade is not None:
+            # 等待后台的 pip 升级完成；升级失败时继续用当前版本的 pip 安装
+            result = self._pip_upgrade.result()
+            self._pip_upgrade = None
+            if result.returncode == 0:
+                print("✅ pip 已升级")
+            else:
+                print(f"⚠️ pip 升级失败，使用当前版本继续: {result.stderr.strip()[-200:]}")
+        
         requirements_file = self.comfyui_dir / "requirements.txt"
         if not requirements_file.exists():
             print("❌ requirements.txt 文件不存在")
             return False
         
         try:
-            # 升级 pip
-            subprocess.run([
-                sys.executable, "-m", "pip", "install", "--upgrade", "pip"
-            ], check=True)
-            
-            # 安装依赖
-            subprocess.run([
-                sys.executable, "-m", "pip", "install", 
-                "-r", str(requirements_file)
-            ], check=True)
+            # 安装依赖：优先用 uv（并行下载和安装），否则用 pip 并优先使用预编译的 wheel
+            if shutil.which("uv"):
+                subprocess.run([
+                    "uv", "pip", "install", "--python", sys.executable,
+                    "-r", str(requirements_file)
+                ], check=True)
+            else:
+                subprocess.run([
+                    sys.executable, "-m", "pip", "install", "--prefer-binary",
+                    "-r", str(requirements_file)
+                ], check=True)
             
             print("✅ 依赖安装完成")
             return True
@@ -155,23 +190,47 @@ class ComfyUIInstaller:
         
         return True
     
-    def download_file(self, url, filepath, description):
-        """下载文件并显示进度"""
-        print(f"📥 下载 {description}...")
-        print(f"   URL: {url}")
-        print(f"   保存到: {filepath}")
-        
-        def progress_hook(block_num, block_size, total_size):
-            if total_size > 0:
-                percent = min(100, (block_num * block_size * 100) // total_size)
-                print(f"\r   进度: {percent}% ", end="", flush=True)
-        
+    def download_file(self, url, filepath, description, parallel=False):
+        """下载文件并显示进度
+
+        parallel=True 时与其他文件同时下载，进度按 10% 分行输出并带上文件名。
+        """
+        with self._print_lock:
+            print(f"📥 下载 {description}...")
+            print(f"   URL: {url}")
+            print(f"   保存到: {filepath}")
+        
+        # 单文件下载时进度在同一行刷新，结束时先换行
+        newline = '' if parallel else '\n'
         try:
-            urllib.request.urlretrieve(url, filepath, progress_hook)
-            print(f"\n✅ {description} 下载完成")
+            with urllib.request.urlopen(url) as response, open(filepath, 'wb') as f:
+                total_size = int(response.headers.get('Content-Length') or 0)
+                copied = 0
+                last_percent = -1
+                # 按 1MB 分块读写，进度只在百分比变化时刷新
+                while True:
+                    chunk = response.read(DOWNLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    copied += len(chunk)
+                    if total_size > 0:
+                        percent = min(100, copied * 100 // total_size)
+                        if parallel:
+                            percent -= percent % 10
+                        if percent != last_percent:
+                            with self._print_lock:
+                                if parallel:
+                                    print(f"   {description} 进度: {percent}%", flush=True)
+                                else:
+                                    print(f"\r   进度: {percent}% ", end="", flush=True)
+                            last_percent = percent
+            with self._print_lock:
+                print(f"{newline}✅ {description} 下载完成")
             return True
         except Exception as e:
-            print(f"\n❌ {description} 下载失败: {e}")
+            with self._print_lock:
+                print(f"{newline}❌ {description} 下载失败: {e}")
             return False
     
     def download_models(self):
@@ -192,6 +251,7 @@ class ComfyUIInstaller:
             return True
         
         success_count = 0
+        pending = []
         for model_type, info in self.models_info.items():
             model_dir = self.comfyui_dir / "models" / model_type
             filepath = model_dir / info["filename"]
@@ -201,8 +261,18 @@ class ComfyUIInstaller:
                 success_count += 1
                 continue
             
-            if self.download_file(info["url"], filepath, info["filename"]):
-                success_count += 1
+            pending.append((info, filepath))
+        
+        # 多个大文件同时下载，总耗时取决于最慢的文件而不是所有文件之和
+        parallel = len(pending) > 1
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL_DOWNLOADS) as executor:
+            futures = [
+                executor.submit(self.download_file, info["url"], filepath, info["filename"], parallel)
+                for info, filepath in pending
+            ]
+            for future in as_completed(futures):
+                if future.result():
+                    success_count += 1
         
         print(f"\n📊 模型下载完成: {success_count}/{len(self.models_info)}")
         return success_count > 0
@@ -307,6 +377,7 @@ python main.py --listen 0.0.0.0 --port 8000
             print("❌ 系统要求检查失败，安装终止")
             return False
         
+        self.start_pip_upgrade()
         if not self.clone_comfyui():
             print("❌ ComfyUI 克隆失败，安装终止")
             return False
@@ -81,6 +81,22 @@ def create_directories():
     
     return True
 
+def precompile_sources():
+    """预编译项目模块，启动时直接加载 .pyc（以 python -OO 启动时加载 .opt-2.pyc）"""
+    print("\n⚡ 预编译项目模块...")
+    
+    import compileall
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    # 只编译项目根目录下的模块：默认级别供 start.sh / start.bat 使用，
+    # 优化级别2供选择以 python -OO start.py 启动的用户使用
+    if all([compileall.compile_dir(project_dir, maxlevels=0, optimize=level, quiet=1)
+            for level in (-1, 2)]):
+        print("✅ 预编译完成")
+    else:
+        # 预编译只是启动优化，失败不影响安装
+        print("⚠️ 部分模块预编译失败，将在首次启动时编译")
+    return True
+
 def check_services():
     """检查外部服务"""
     print("\n🔍 检查外部服务...")
@@ -116,6 +132,9 @@ def main():
         print("\n❌ 目录创建失败")
         sys.exit(1)
     
+    # 预编译模块
+    precompile_sources()
+    
     # 检查服务
     check_services()
     
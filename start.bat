@@ -24,6 +24,6 @@ if not exist "config.json" (
 
 REM 启动应用
 echo ✅ 启动应用...
-python app.py
+python start.py
 
 pause
\ No newline at end of file
@@ -7,17 +7,22 @@ AI Image Tree System 启动脚本
 
 import os
 import sys
-import json
-from pathlib import Path
+from functools import lru_cache
+from importlib.util import find_spec
 
-# 强制设置UTF-8编码（Windows兼容性）
-if sys.platform.startswith('win'):
+def configure_windows_utf8():
+    """强制设置UTF-8编码（Windows兼容性）"""
     import locale
     import codecs
+    import ctypes
     
     try:
-        # 设置控制台代码页为UTF-8
-        os.system('chcp 65001 >nul 2>&1')
+        # 设置控制台代码页为UTF-8：直接调用控制台 API，已是 UTF-8 时不做任何事，
+        # 不再每次启动都通过 cmd 执行 chcp
+        kernel32 = ctypes.windll.kernel32
+        if kernel32.GetConsoleOutputCP() != 65001:
+            kernel32.SetConsoleOutputCP(65001)
+            kernel32.SetConsoleCP(65001)
         
         # 设置环境变量
         os.environ['PYTHONIOENCODING'] = 'utf-8'
@@ -51,41 +56,126 @@ if sys.platform.startswith('win'):
         print(f"Warning: Failed to set UTF-8 encoding: {e}")
         pass
 
-def check_config():
-    """检查配置文件"""
-    config_file = Path("config.json")
-    if not config_file.exists():
-        print("❌ 配置文件不存在")
-        print("💡 请先运行: python setup.py")
-        return False
+# 配置检查结果缓存：(配置文件路径, mtime_ns, size, 是否通过, 提示列表)
+VALIDATION_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "aits", "validated.pkl")
+# 旧版本缓存的解析后配置，已不再读取，写入新缓存时顺带删除
+LEGACY_CONFIG_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "aits", "config.pkl")
+
+# 本进程内已完成的检查结果：配置文件名 -> (是否通过, 提示列表)，重复调用时连 stat 也省去
+_VALIDATION_CACHE = {}
+
+def _read_config(config_file):
+    """读取并解析配置文件；文件不存在时抛出 FileNotFoundError"""
+    with open(config_file, 'rb') as f:
+        data = f.read()
     
+    # 以字节形式交给 JSON 解析器，由解析器按 UTF-8 解码
     try:
-        # 强制使用UTF-8编码读取配置文件
-        with open(config_file, 'r', encoding='utf-8', errors='replace') as f:
-            config = json.load(f)
-        
-        # 检查基本配置
-        if not config.get('ai_provider', {}).get('base_url'):
-            print("⚠️ AI提供商配置不完整，请检查 config.json")
-        
-        if not config.get('comfyui', {}).get('url'):
-            print("⚠️ ComfyUI配置不完整，请检查 config.json")
+        import orjson
+        return orjson.loads(data)
+    except ImportError:
+        import json
+        return json.loads(data)
+
+def _load_validation_cache(key):
+    """读取上次的检查结果，配置文件未变化（路径/mtime/大小相同）时才有效"""
+    # 只在需要时导入，依赖检查失败提前退出时不必加载 pickle
+    import pickle
+    
+    try:
+        with open(VALIDATION_CACHE_FILE, 'rb') as f:
+            cached = pickle.load(f)
+        if cached[:3] == key:
+            return cached[3:]
+    except Exception:
+        # 缓存不存在或已损坏，重新检查
+        pass
+    return None
+
+def _save_validation_cache(key, result):
+    """保存检查结果，先写临时文件再替换，避免并发启动时读到写了一半的缓存"""
+    import pickle
+    
+    try:
+        os.makedirs(os.path.dirname(VALIDATION_CACHE_FILE), exist_ok=True)
+        tmp_file = f"{VALIDATION_CACHE_FILE}.{os.getpid()}.tmp"
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(key + result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, VALIDATION_CACHE_FILE)
+        if os.path.exists(LEGACY_CONFIG_CACHE_FILE):
+            os.remove(LEGACY_CONFIG_CACHE_FILE)
+    except OSError:
+        # 缓存只是优化，写入失败不影响启动
+        pass
+
+# 必填配置项：(键路径, 缺失时的提示)
+REQUIRED_CONFIG_KEYS = (
+    (('ai_provider', 'base_url'), "⚠️ AI提供商配置不完整，请检查 config.json"),
+    (('comfyui', 'url'), "⚠️ ComfyUI配置不完整，请检查 config.json"),
+)
+
+def _missing(config, path):
+    """沿键路径逐层查找，任一层不是字典或值为空即视为缺失"""
+    current = config
+    for key in path:
+        if not isinstance(current, dict) or not current.get(key):
+            return True
+        current = current[key]
+    return False
+
+def _validate_config(config_file):
+    """完整读取并检查配置文件，返回 (是否通过, 提示列表)"""
+    try:
+        config = _read_config(config_file)
+    except FileNotFoundError:
+        return False, ["❌ 配置文件不存在", "💡 请先运行: python setup.py"]
+    except (OSError, ValueError) as e:
+        return False, [f"❌ 配置文件读取失败: {e}"]
+    
+    # 检查基本配置
+    warnings = [warning for path, warning in REQUIRED_CONFIG_KEYS if _missing(config, path)]
+    return True, warnings
+
+def check_config():
+    """检查配置文件；配置文件未变化时直接使用上次的检查结果（失败结果不缓存）"""
+    config_file = "config.json"
+    result = _VALIDATION_CACHE.get(config_file)
+    
+    if result is None:
+        try:
+            stat = os.stat(config_file)
+        except OSError:
+            # 文件不存在或无法访问，交给完整检查输出具体原因
+            stat = None
         
-        return True
-    except Exception as e:
-        print(f"❌ 配置文件读取失败: {e}")
-        return False
+        if stat is None:
+            result = _validate_config(config_file)
+        else:
+            key = (os.path.realpath(config_file), stat.st_mtime_ns, stat.st_size)
+            result = _load_validation_cache(key)
+            if result is None:
+                result = _validate_config(config_file)
+                if result[0]:
+                    _save_validation_cache(key, result)
+            if result[0]:
+                _VALIDATION_CACHE[config_file] = result
+    
+    ok, warnings = result
+    for warning in warnings:
+        print(warning)
+    return ok
+
+# 启动所需的第三方依赖（asyncio 属于标准库，无需检查）
+REQUIRED_MODULES = ('flask', 'aiohttp')
+
+@lru_cache(maxsize=None)
+def _have(module):
+    """只查找模块是否存在，不执行导入；结果缓存，重复检查时不再遍历查找器"""
+    return find_spec(module) is not None
 
 def check_dependencies():
     """检查依赖"""
-    required_modules = ['flask', 'aiohttp', 'asyncio']
-    missing = []
-    
-    for module in required_modules:
-        try:
-            __import__(module)
-        except ImportError:
-            missing.append(module)
+    missing = [module for module in REQUIRED_MODULES if not _have(module)]
     
     if missing:
         print(f"❌ 缺少依赖: {', '.join(missing)}")
@@ -96,6 +186,10 @@ def check_dependencies():
 
 def main():
     """主启动流程"""
+    # 在第一次输出前切换控制台编码
+    if sys.platform.startswith('win'):
+        configure_windows_utf8()
+    
     print("🚀 启动 AI Image Tree System...")
     
     # 检查依赖
@@ -110,33 +204,27 @@ def main():
     try:
         print("✅ 检查通过，启动应用...")
         
-        # 更安全的方式启动应用 - 直接导入而不是使用importlib
+        # 直接导入app模块并调用其入口函数（与 python app.py 的启动方式一致）
         try:
-            # 直接导入app模块
             import app
-            # 如果app模块有main函数，调用它；否则直接运行Flask应用
-            if hasattr(app, 'main'):
-                app.main()
-            elif hasattr(app, 'app'):
-                # 启动Flask应用
-                app.app.run(host='localhost', port=8080, debug=False, threaded=True)
-            else:
-                print("❌ 无法找到应用入口点")
-                sys.exit(1)
-                
         except ImportError as e:
             print(f"❌ 导入应用模块失败: {e}")
             print("💡 请检查app.py文件是否存在且语法正确")
             sys.exit(1)
-            
+        
+        app.main()
+        
     except Exception as e:
         print(f"❌ 启动失败: {e}")
         print("💡 请检查配置和依赖")
         
-        # 输出更详细的错误信息用于调试
-        import traceback
-        print("\n详细错误信息:")
-        traceback.print_exc()
+        # 设置 AITS_DEBUG=1 时才输出详细错误信息，正常启动不加载 traceback
+        if os.environ.get('AITS_DEBUG'):
+            import traceback
+            print("\n详细错误信息:")
+            traceback.print_exc()
+        else:
+            print("💡 设置环境变量 AITS_DEBUG=1 可查看详细错误信息")
         
         sys.exit(1)
 
@@ -22,4 +22,4 @@ fi
 
 # 启动应用
 echo "✅ 启动应用..."
-python3 app.py
\ No newline at end of file
+python3 start.py
\ No newline at end of file